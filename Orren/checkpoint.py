@@ -0,0 +1,45 @@
+import numpy as np
+from checkpointfile import Checkpointer, stack, unstack
+
+# Checkpoints of an Orren network's weights and neuron state for long learning
+# runs. The state of a network is a flat dict of numpy arrays, built from the
+# neurons', RateWindows' and projections' get_state and handed back to their
+# set_state, and saved with a Checkpointer from checkpointfile.
+
+# The RateWindows neurons use, with the rows of the neurons in each
+def windows_of(neurons):
+	windows = []
+	rows = []
+	for neuron in neurons:
+		if neuron.window is None:
+			continue
+		for k, window in enumerate(windows):
+			if window is neuron.window:
+				rows[k].append(neuron.row)
+				break
+		else:
+			windows.append(neuron.window)
+			rows.append([neuron.row])
+	return [(window, np.array(r, dtype = np.int64)) for window, r in zip(windows, rows)]
+
+# The state of neurons, the RateWindows they use and projections as one dict
+def network_state(neurons, projections = ()):
+	state = stack([neuron.get_state() for neuron in neurons], 'neuron.')
+	for k, (window, rows) in enumerate(windows_of(neurons)):
+		for key, value in window.get_state(rows).items():
+			state['window%d.%s' % (k, key)] = np.asarray(value)
+	for k, proj in enumerate(projections):
+		for key, value in proj.get_state().items():
+			state['projection%d.%s' % (k, key)] = np.asarray(value)
+	return state
+
+# Puts a network_state back into the same network, built the same way
+def restore_network(state, neurons, projections = ()):
+	for neuron, neuron_state in zip(neurons, unstack(state, 'neuron.', len(neurons))):
+		neuron.set_state(neuron_state)
+	for k, (window, rows) in enumerate(windows_of(neurons)):
+		prefix = 'window%d.' % k
+		window.set_state({name[len(prefix):]: value for name, value in state.items() if name.startswith(prefix)}, rows)
+	for k, proj in enumerate(projections):
+		prefix = 'projection%d.' % k
+		proj.set_state({name[len(prefix):]: value for name, value in state.items() if name.startswith(prefix)})
@@ -0,0 +1,168 @@
+import os
+import json
+import zlib
+import numpy as np
+
+# The file format of checkpoints, used by checkpoint.py to save an Orren
+# network. A checkpoint holds a flat dict of numpy arrays, whatever the
+# network put in it. samkg/checkpoint.py writes the same files, keep FORMAT
+# in step with it.
+#
+# Every full_every-th checkpoint is a full snapshot, the ones in between only
+# store how they differ from the last full one: the bits of every array XORed
+# with the same array in the snapshot. Unchanged values XOR to zeros, and
+# values that only changed a little to zeros in their sign, exponent and top
+# bits, so the bytes are regrouped by their position in the value before
+# compressing to keep those zeros together. Everything is zlib compressed in
+# an .npz file, written to a temporary file first so a crash never leaves half
+# a checkpoint. Loading a checkpoint gives back exactly the arrays that were
+# saved, so a run resumed from one carries on bit for bit (as long as its
+# inputs do).
+
+FORMAT = 1
+
+def as_bytes(array):
+	return np.frombuffer(np.ascontiguousarray(array).tobytes(), dtype = np.uint8)
+
+def compress(raw, itemsize):
+	return np.frombuffer(zlib.compress(raw.reshape(-1, itemsize).T.tobytes()), dtype = np.uint8)
+
+# Stored against base when that comes out smaller, it doesn't for arrays
+# whose values have all moved, like a sliding window of spikes
+def encode(array, base = None):
+	raw = compress(as_bytes(array), array.dtype.itemsize)
+	if base is not None and base.dtype == array.dtype and base.shape == array.shape:
+		xor = compress(as_bytes(array) ^ as_bytes(base), array.dtype.itemsize)
+		if len(xor) < len(raw):
+			return 'xor', xor
+	return 'raw', raw
+
+def decode(encoding, data, dtype, shape, base = None):
+	dtype = np.dtype(dtype)
+	raw = np.frombuffer(zlib.decompress(data.tobytes()), dtype = np.uint8)
+	raw = raw.reshape(dtype.itemsize, -1).T.ravel()
+	if encoding == 'xor':
+		raw = raw ^ as_bytes(base)
+	return np.frombuffer(raw.tobytes(), dtype = dtype).reshape(shape).copy()
+
+def write(path, state, step, base = None, base_name = None):
+	meta = {'format': FORMAT, 'step': step, 'base': base_name, 'arrays': {}}
+	arrays = {}
+	for k, (name, value) in enumerate(sorted(state.items())):
+		value = np.asarray(value)
+		encoding, data = encode(value, None if base is None else base.get(name))
+		meta['arrays'][name] = [k, encoding, value.dtype.str, list(value.shape)]
+		arrays['a%d' % k] = data
+	arrays['meta'] = np.array(json.dumps(meta))
+	tmp = path + '.tmp'
+	with open(tmp, 'wb') as f:
+		np.savez(f, **arrays)
+	os.replace(tmp, path)
+
+def read_meta(path):
+	with np.load(path) as f:
+		return json.loads(str(f['meta']))
+
+def read(path, base = None):
+	with np.load(path) as f:
+		meta = json.loads(str(f['meta']))
+		if meta['format'] != FORMAT:
+			raise IOError("%s is a checkpoint from another version" % path)
+		if meta['base'] is not None and base is None:
+			raise IOError("%s is stored against %s" % (path, meta['base']))
+		state = {}
+		for name, (k, encoding, dtype, shape) in meta['arrays'].items():
+			state[name] = decode(encoding, f['a%d' % k], dtype, shape,
+								None if base is None else base.get(name))
+	return state, meta
+
+class Checkpointer:
+	def __init__(self, directory, full_every = 10):
+		self.directory = directory
+		self.full_every = full_every
+		self.count = 0
+		self.base = None
+		self.base_name = None
+		try:
+			os.makedirs(directory)
+		except OSError:
+			pass
+
+	def checkpoints(self):
+		names = [f for f in os.listdir(self.directory) if f.startswith('ckpt-') and f.endswith('.npz')]
+		return sorted(names)
+
+	# Saves state as of step, as a full snapshot or against the last one
+	def save(self, state, step):
+		name = 'ckpt-%010d.npz' % step
+		path = os.path.join(self.directory, name)
+		if self.base is None or self.count % self.full_every == 0:
+			write(path, state, step)
+			previous = self.base_name
+			self.base = {key: np.array(value) for key, value in state.items()}
+			self.base_name = name
+			self.count = 1
+			# Only the last two full snapshots and what was saved since are kept
+			if previous is not None:
+				self.prune(previous)
+		else:
+			write(path, state, step, self.base, self.base_name)
+			self.count += 1
+		return path
+
+	# Removes the checkpoints from before the full snapshot keep
+	def prune(self, keep):
+		for name in self.checkpoints():
+			if name < keep:
+				os.remove(os.path.join(self.directory, name))
+
+	# The state and step saved in path, the latest checkpoint if not given.
+	# Saving carries on against the same full snapshot.
+	def load(self, path = None):
+		if path is None:
+			names = self.checkpoints()
+			if not names:
+				return None, None
+			path = os.path.join(self.directory, names[-1])
+		base_name = read_meta(path)['base']
+		if base_name is None:
+			state, meta = read(path)
+			base, base_name = state, os.path.basename(path)
+		else:
+			base, _ = read(os.path.join(self.directory, base_name))
+			state, meta = read(path, base)
+		self.base = {key: np.array(value) for key, value in base.items()}
+		self.base_name = base_name
+		self.count = sum(1 for name in self.checkpoints() if base_name <= name <= os.path.basename(path))
+		return state, meta['step']
+
+# Per neuron states as arrays, lists (like synapse weights) are joined into
+# one array with how long each neuron's was next to it
+def stack(states, prefix):
+	out = {}
+	if not states:
+		return out
+	for key in states[0]:
+		values = [state[key] for state in states]
+		if isinstance(values[0], list):
+			lengths = [len(value) for value in values]
+			out[prefix + key] = np.array([x for value in values for x in value])
+			out[prefix + key + '.len'] = np.array(lengths, dtype = np.int64)
+		else:
+			out[prefix + key] = np.array(values)
+	return out
+
+def unstack(state, prefix, n):
+	states = [{} for _ in range(n)]
+	for name, values in state.items():
+		if not name.startswith(prefix) or name.endswith('.len'):
+			continue
+		key = name[len(prefix):]
+		if prefix + key + '.len' in state:
+			ends = np.cumsum(state[prefix + key + '.len'])
+			for i, value in enumerate(np.split(values, ends[:-1]) if n else []):
+				states[i][key] = value.tolist()
+		else:
+			for i, value in enumerate(values.tolist()):
+				states[i][key] = value
+	return states
@@ -5,10 +5,127 @@ import math
 t_window = 10
 t_step = 5
 
+# Spike windows of a group of hebbian neurons, one row per neuron. Spikes are
+# staged in batches of t_step/dt and moved into a window of the last
+# t_window/dt of them when the next one comes in, which itself is dropped.
+# The window is a ring buffer and the number of spikes in it is kept up to
+# date as batches go in and old spikes fall out, so the rate is never summed
+# over the whole window. Every neuron's rate is in rates, to be read all at
+# once by the learning rules.
+#
+# Give the neurons of a population one window between them by passing the
+# same window = RateWindow() to each. A hebbian neuron that isn't given one
+# gets a window of its own.
+class RateWindow:
+	def __init__(self, capacity = 64):
+		self.size = 0
+		self.capacity = capacity
+		self.dt = None
+		# Number of times any row has been flushed
+		self.flushes = 0
+		self.staged = None
+		self.ring = None
+		self.count = np.zeros(capacity, dtype = np.int64)
+		self.head = np.zeros(capacity, dtype = np.int64)
+		self.length = np.zeros(capacity, dtype = np.int64)
+		self.sums = np.zeros(capacity, dtype = np.int64)
+		self.rates = np.zeros(capacity)
+	
+	def grow(self, capacity):
+		for name in ['count', 'head', 'length', 'sums', 'rates', 'staged', 'ring']:
+			old = getattr(self, name)
+			if old is not None:
+				new = np.zeros((capacity,) + old.shape[1:], dtype = old.dtype)
+				new[:self.size] = old[:self.size]
+				setattr(self, name, new)
+		self.capacity = capacity
+	
+	def add_row(self):
+		if self.size == self.capacity:
+			self.grow(2*self.capacity)
+		self.size += 1
+		return self.size - 1
+	
+	# The staging and window lengths are fixed by the dt of the first spike
+	def setup(self, dt):
+		self.dt = dt
+		self.batch = int(t_step/dt)
+		self.window = int(math.floor(t_window/dt))
+		self.staged = np.zeros((self.capacity, self.batch), dtype = np.int8)
+		self.ring = np.zeros((self.capacity, self.window), dtype = np.int8)
+	
+	# Adds a spike (or not) to row's staged batch and returns its rate
+	def push(self, row, val, dt):
+		if self.dt is None:
+			self.setup(dt)
+		elif dt != self.dt:
+			raise ValueError("Neurons sharing a RateWindow have to use the same dt")
+		n = self.count[row]
+		if n < self.batch:
+			self.staged[row, n] = val
+			self.count[row] = n + 1
+		else:
+			self.flush(row)
+			self.count[row] = 0
+			# Need a fudge factor to make the spike rates reasonable
+			self.rates[row] = float(self.sums[row])/(t_window/(dt*25))
+		return self.rates.item(row)
+	
+	def flush(self, row):
+		self.flushes += 1
+		vals = self.staged[row]
+		head = self.head[row]
+		length = self.length[row]
+		if self.batch > self.window:
+			self.ring[row] = vals[self.batch - self.window:]
+			self.head[row] = 0
+			self.length[row] = self.window
+			self.sums[row] = int(self.ring[row].sum())
+			return
+		over = max(length + self.batch - self.window, 0)
+		if over:
+			self.sums[row] -= int(self.ring[row, (head + np.arange(over)) % self.window].sum())
+			head = (head + over) % self.window
+			length -= over
+		self.ring[row, (head + length + np.arange(self.batch)) % self.window] = vals
+		self.sums[row] += int(vals.sum())
+		self.head[row] = head
+		self.length[row] = length + self.batch
+	
+	# The windows of the neurons in rows
+	def get_state(self, rows):
+		state = {'flushes': self.flushes, 'dt': np.nan if self.dt is None else self.dt}
+		for name in ['count', 'head', 'length', 'sums', 'rates', 'staged', 'ring']:
+			if getattr(self, name) is not None:
+				state[name] = getattr(self, name)[rows]
+		return state
+	
+	def set_state(self, state, rows):
+		self.flushes = int(state['flushes'])
+		if not np.isnan(state['dt']):
+			if self.dt is None:
+				self.setup(float(state['dt']))
+			elif self.dt != float(state['dt']):
+				raise ValueError("Neurons sharing a RateWindow have to use the same dt")
+		for name in ['count', 'head', 'length', 'sums', 'rates', 'staged', 'ring']:
+			if name in state:
+				getattr(self, name)[rows] = state[name]
+	
+	# The spikes in row's window, oldest first
+	def contents(self, row):
+		if self.ring is None:
+			return []
+		idx = (self.head[row] + np.arange(self.length[row])) % self.window
+		return self.ring[row, idx].tolist()
+
 class Synapse:
 	def __init__(self, n_pre, n_post, tau = 1, w_init = 0.5, type = 'hebbian', **kwargs):
 		self.n_pre = n_pre
 		self.n_post = n_post
+		# Set when a plasticity.Projection takes the synapse over, w then lives
+		# in the projection's weight array
+		self.projection = None
+		self.slot = None
 		self.w = w_init
 		self.I = 0
 		self.tau = tau
@@ -26,16 +143,27 @@ class Synapse:
 			self.x_j = 0
 			self.y_i = 0
 			
+	@property
+	def w(self):
+		if self.projection is None:
+			return self._w
+		return self.projection.w.item(self.slot)
+	
+	@w.setter
+	def w(self, w):
+		if self.projection is None:
+			self._w = w
+		else:
+			self.projection.w[self.slot] = w
+	
 	def update(self, dt):
 		dIdt = (-self.I/self.tau) + self.n_pre.currspike
 		self.I = self.I + dt*dIdt
 	
 	def learn(self, dt):
 		if(self.type == 'hebbian'):
-			dw = 0
-			for _ in range(4):
-				dw += 0.25 * self.gamma * (self.n_post.spike_rate * 
-							(self.n_pre.spike_rate - self.w*self.n_post.spike_rate))
+			dw = self.gamma * (self.n_post.spike_rate * 
+						(self.n_pre.spike_rate - self.w*self.n_post.spike_rate))
 			self.w = self.w + dw
 			
 		elif(self.type == 'stdp'):
@@ -50,6 +178,16 @@ class Synapse:
 			
 	def sout(self):
 		return self.sign * self.w * self.I
+	
+	def get_state(self):
+		return {'w': self.w, 'I': self.I, 'x_j': getattr(self, 'x_j', 0), 'y_i': getattr(self, 'y_i', 0)}
+	
+	def set_state(self, state):
+		self.w = state['w']
+		self.I = state['I']
+		if self.type == 'stdp':
+			self.x_j = state['x_j']
+			self.y_i = state['y_i']
 
 class Neuron:
 	def __init__(self, v_r = 0, R_m = 1, tau = 1, threshold = 0.2, type = "hebbian", **kwargs):
@@ -60,13 +198,46 @@ class Neuron:
 		self.threshold = threshold
 		self.type = type
 		self.syns = []
-		self.spikes = Queue()
-		self.spikestoadd = []
+		# Projections that learn when this neuron is updated with learn
+		self.projections = []
+		self.window = None
+		self.row = None
+		if type == 'hebbian':
+			self.window = kwargs.get('window', None)
+			if self.window is None:
+				self.window = RateWindow(capacity = 1)
+			self.row = self.window.add_row()
+		self._spikes = Queue()
 		self.currspike = 0
 		self.spike_rate = 0
 		self.isteacher = kwargs.get('isteacher', False)
 		self.isinput = kwargs.get('isinput', False)
 	
+	@property
+	def spikes(self):
+		if self.window is not None:
+			return self.window.contents(self.row)
+		return self._spikes
+	
+	# Everything that changes as the neuron runs, its synapses' included, as
+	# numbers and lists of numbers. The rest of a hebbian neuron's spike
+	# window is in its RateWindow.
+	def get_state(self):
+		syns = [syn.get_state() for syn in self.syns]
+		state = {'v': self.v, 'currspike': self.currspike, 'spike_rate': self.spike_rate,
+				'spikes': list(self._spikes)}
+		for name in ['w', 'I', 'x_j', 'y_i']:
+			state['syn_' + name] = [syn[name] for syn in syns]
+		return state
+	
+	def set_state(self, state):
+		self.v = state['v']
+		self.currspike = state['currspike']
+		self.spike_rate = state['spike_rate']
+		self._spikes = Queue(state['spikes'])
+		for k, syn in enumerate(self.syns):
+			syn.set_state({name: state['syn_' + name][k] for name in ['w', 'I', 'x_j', 'y_i']})
+	
 	def add_syn(self, n_pre, tau = 1, w_init = 0.5, **kwargs):
 		syn = Synapse(n_pre, self, tau = tau, w_init = w_init, type = self.type, **kwargs)
 		self.syns.append(syn)
@@ -91,31 +262,23 @@ class Neuron:
 	
 	def add_spike(self, val, dt):
 		self.currspike = val
-		if self.type == 'hebbian':
-			global t_step;
-			global t_window;
-			if len(self.spikestoadd) < int(t_step/dt):
-				self.spikestoadd.append(val)
-			else:
-				for spike in self.spikestoadd:
-					self.spikes.append(spike)
-					if(len(self.spikes) > t_window/dt):
-						self.spikes.popleft()
-				self.spikestoadd = []
-			# Need a fudge factor to make the spike rates reasonable
-			self.spike_rate = float(sum(self.spikes))/(t_window/(dt*25))
+		if self.window is not None:
+			self.spike_rate = self.window.push(self.row, val, dt)
 		else:
-			self.spikes.append(val)
-			if(len(self.spikes) > t_window/dt):
-						self.spikes.popleft()
+			self._spikes.append(val)
+			if(len(self._spikes) > t_window/dt):
+						self._spikes.popleft()
 	
 	def update(self, dt, I_inj = 0, learn = False):
+		if learn:
+			for proj in self.projections:
+				proj.learn(dt)
 		if not self.isteacher:
 			for syn in self.syns:
 				syn.update(dt)
 				# If the presynapitc neuron is a teacher, don't change its weights
-				# otherwise do.
-				if learn and not syn.n_pre.isteacher:
+				# otherwise do. Synapses in a Projection learn with the rest of it.
+				if learn and not syn.n_pre.isteacher and syn.projection is None:
 				  syn.learn(dt)
 		# If this neuron is a teacher or input, then we just take in the injected current i.e.
 		# no synaptic connections
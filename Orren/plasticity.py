@@ -0,0 +1,292 @@
+import numpy as np
+
+# Learning for a whole projection at once. A Projection takes over every
+# synapse of the given type going from a neuron in pre to a neuron in post,
+# and keeps their weights in one array with the pre and post neuron of every
+# synapse next to it, so a learning step is a few array operations instead
+# of a call per synapse. The Synapse objects stay where they are and read
+# and write their weight through the projection.
+#
+# Synapses that belong to a projection are skipped by Neuron.update(learn =
+# True), which instead has the whole projection learn when its first post
+# neuron is updated. That's the same point in the step as the synapses used
+# to learn at, after the pre neurons have been updated and before the post
+# neurons' own update, so update the pre neurons first as usual. Calling
+# learn(dt) directly has to be done at that point too. Like the len(spikes)
+# check in Synapse.learn, STDP learns nothing until both pre and post neurons
+# have been updated once.
+#
+# For STDP the x_j and y_i traces only depend on the pre and post neuron, so
+# the projection keeps one x per presynaptic and one y per postsynaptic
+# neuron instead of a copy of both in every synapse, and the synapses' own
+# x_j and y_i aren't used. A weight only changes when its pre or post neuron
+# spikes, so only the synapses of neurons that spiked this step are looked
+# at, found through the synapses sorted by pre and by post neuron.
+#
+# Learning doesn't have to happen every step. With every = K a projection
+# only changes its weights every K calls to learn, and with on_flush = True
+# whenever the neurons' RateWindow flushes, which is when hebbian rates
+# change. In between, learn only adds up what the rules need: for Oja's rule
+# each post neuron's rate squared and each synapse's pre rate times post
+# rate, or for STDP each neuron's spikes times its trace. The rates only
+# change now and then (on a flush for a shared RateWindow), so the products
+# are only added once for every run of steps at the same rates. The weights
+# are then updated in one go, Oja's rule as that many steps at the average
+# of the products, which is exact when the rates stayed the same, and STDP
+# by solving the soft bounded rule for the summed eligibility, which keeps
+# the weights between 0 and 1 however much was added up. Call apply() to
+# bring the weights up to date in between.
+
+def expand_ranges(starts, ends):
+	counts = ends - starts
+	pos = np.arange(counts.sum()) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+	return pos
+
+# Synapses in order of neuron idx, and where each neuron's run of them starts
+def sort_by(idx, n):
+	order = np.argsort(idx, kind = 'stable')
+	return order, np.searchsorted(idx[order], np.arange(n + 1))
+
+# The RateWindow all of neurons keep their rates in and their rows in it, so
+# the rates can be read in one go, or None if they don't share one
+def rate_rows(neurons):
+	if neurons and neurons[0].window is not None:
+		window = neurons[0].window
+		if all(neuron.window is window for neuron in neurons):
+			return window, np.array([neuron.row for neuron in neurons], dtype = np.int64)
+	return None, None
+
+class Projection:
+	def __init__(self, pre, post, type = 'hebbian', **kwargs):
+		self.pre = list(pre)
+		self.post = list(post)
+		self.type = type
+		pre_index = {id(neuron): i for i, neuron in enumerate(self.pre)}
+		synapses = []
+		pre_idx = []
+		post_idx = []
+		for j, neuron in enumerate(self.post):
+			for syn in neuron.syns:
+				if syn.type == type and syn.projection is None and id(syn.n_pre) in pre_index:
+					synapses.append(syn)
+					pre_idx.append(pre_index[id(syn.n_pre)])
+					post_idx.append(j)
+		self.synapses = synapses
+		self.pre_idx = np.array(pre_idx, dtype = np.int64)
+		self.post_idx = np.array(post_idx, dtype = np.int64)
+		self.w = np.array([syn.w for syn in synapses], dtype = float)
+		if type == 'hebbian':
+			self.gamma = np.array([syn.gamma for syn in synapses], dtype = float)
+		elif type == 'stdp':
+			self.eta_p = np.array([syn.eta_p for syn in synapses], dtype = float)
+			self.eta_m = np.array([syn.eta_m for syn in synapses], dtype = float)
+			self.tau_p = self.shared([syn.tau_p for syn in synapses], kwargs.get('tau_p', 1))
+			self.tau_m = self.shared([syn.tau_m for syn in synapses], kwargs.get('tau_m', 1))
+			self.x = np.zeros(len(self.pre))
+			self.y = np.zeros(len(self.post))
+			self.by_pre, self.pre_ptr = sort_by(self.pre_idx, len(self.pre))
+			self.by_post, self.post_ptr = sort_by(self.post_idx, len(self.post))
+		for k, syn in enumerate(synapses):
+			syn.projection = self
+			syn.slot = k
+		self.pre_window, self.pre_rows = rate_rows(self.pre)
+		self.post_window, self.post_rows = rate_rows(self.post)
+		self.update_mask()
+		if self.post:
+			self.post[0].projections.append(self)
+		self.every = kwargs.get('every', 1)
+		self.on_flush = kwargs.get('on_flush', False)
+		if self.on_flush:
+			self.flush_window = self.post_window or self.pre_window
+			if self.flush_window is None:
+				raise ValueError("on_flush needs neurons that share a RateWindow")
+			self.flushes = self.flush_window.flushes
+		self.clear_stats()
+	
+	def __len__(self):
+		return len(self.synapses)
+	
+	# A trace time constant has to be the same for the whole projection now
+	# that the traces are shared
+	def shared(self, values, default):
+		values = set(values)
+		if len(values) > 1:
+			raise ValueError("STDP synapses in one projection need the same tau_p and tau_m")
+		return values.pop() if values else default
+	
+	# Weights from teachers stay as they are and teachers don't learn their
+	# own inputs either, only the synapses in plastic are ever changed
+	def update_mask(self):
+		pre_teacher = np.array([neuron.isteacher for neuron in self.pre], dtype = bool)
+		post_teacher = np.array([neuron.isteacher for neuron in self.post], dtype = bool)
+		self.mask = ~pre_teacher[self.pre_idx] & ~post_teacher[self.post_idx]
+		self.plastic = np.nonzero(self.mask)[0]
+	
+	# Hands the synapses their weights back and lets them go
+	def release(self):
+		for syn in self.synapses:
+			w = float(self.w[syn.slot])
+			syn.projection = None
+			syn.slot = None
+			syn.w = w
+		self.synapses = []
+		if self.post:
+			self.post[0].projections.remove(self)
+	
+	def rates(self, neurons):
+		if neurons is self.pre and self.pre_window is not None:
+			return self.pre_window.rates[self.pre_rows]
+		if neurons is self.post and self.post_window is not None:
+			return self.post_window.rates[self.post_rows]
+		return np.array([neuron.spike_rate for neuron in neurons], dtype = float)
+	
+	def spikes(self, neurons):
+		return np.array([neuron.currspike for neuron in neurons], dtype = float)
+	
+	def learn(self, dt):
+		if self.type == 'stdp' and (len(self.pre[0].spikes) == 0 or len(self.post[0].spikes) == 0):
+			return
+		if self.every == 1 and not self.on_flush:
+			if self.type == 'hebbian':
+				self.hebbian()
+			elif self.type == 'stdp':
+				self.stdp(dt)
+			return
+		if self.on_flush:
+			# Rates have just changed, what was added up so far is from before
+			if self.flush_window.flushes != self.flushes:
+				self.flushes = self.flush_window.flushes
+				self.apply()
+		self.accumulate(dt)
+		if not self.on_flush and self.pending >= self.every:
+			self.apply()
+	
+	# Weights, traces and whatever has been added up towards the next update
+	def get_state(self):
+		state = {'w': self.w.copy(), 'pending': self.pending, 'dt': self.dt}
+		names = {'hebbian': ['post_sq', 'prepost', 'held_pre', 'held_post'], 'stdp': ['x', 'y', 'ltp', 'ltd']}
+		for name in names.get(self.type, []):
+			state[name] = getattr(self, name).copy()
+		if self.type == 'hebbian':
+			state['held'] = self.held
+		if self.on_flush:
+			state['flushes'] = self.flushes
+		return state
+	
+	def set_state(self, state):
+		self.w[:] = state['w']
+		self.pending = int(state['pending'])
+		self.dt = float(state['dt'])
+		for name in ['post_sq', 'prepost', 'held_pre', 'held_post', 'x', 'y', 'ltp', 'ltd']:
+			if name in state:
+				setattr(self, name, np.array(state[name], dtype = float))
+		if 'held' in state:
+			self.held = int(state['held'])
+		if 'flushes' in state:
+			self.flushes = int(state['flushes'])
+	
+	def clear_stats(self):
+		self.pending = 0
+		self.dt = 0.0
+		if self.type == 'hebbian':
+			self.post_sq = np.zeros(len(self.post))
+			self.prepost = np.zeros(len(self.w))
+			# The rates of the current run of steps and how many steps it has
+			self.held_pre = np.zeros(len(self.pre))
+			self.held_post = np.zeros(len(self.post))
+			self.held = 0
+		elif self.type == 'stdp':
+			self.ltp = np.zeros(len(self.pre))
+			self.ltd = np.zeros(len(self.post))
+	
+	def accumulate(self, dt):
+		self.pending += 1
+		self.dt = dt
+		if self.type == 'hebbian':
+			pre = self.rates(self.pre)
+			post = self.rates(self.post)
+			if self.held and not (np.array_equal(pre, self.held_pre) and np.array_equal(post, self.held_post)):
+				self.fold()
+			if self.held == 0:
+				self.held_pre = pre
+				self.held_post = post
+			self.held += 1
+			self.post_sq += post*post
+		elif self.type == 'stdp':
+			pre_spike, post_spike = self.step_traces(dt)
+			self.ltp += pre_spike*self.x
+			self.ltd += post_spike*self.y
+	
+	# Adds pre rate times post rate for the steps held at the same rates
+	def fold(self):
+		if self.held == 0:
+			return
+		k = self.plastic
+		self.prepost[k] += self.held*(self.held_post[self.post_idx[k]]*self.held_pre[self.pre_idx[k]])
+		self.held = 0
+	
+	# Updates the weights with everything added up since they last were
+	def apply(self):
+		if self.pending == 0:
+			return
+		if self.type == 'hebbian':
+			self.fold()
+			n = self.pending
+			k = self.plastic
+			post_sq = (self.post_sq/n)[self.post_idx[k]]
+			# n steps of w <- w*(1 - a) + b
+			a = self.gamma[k]*post_sq
+			b = self.gamma[k]*(self.prepost[k]/n)
+			decay = (1 - a)**n
+			gain = np.full(len(k), float(n))
+			moving = a != 0
+			gain[moving] = (1 - decay[moving])/a[moving]
+			self.w[k] = decay*self.w[k] + b*gain
+		elif self.type == 'stdp':
+			self.update_weights(self.dt, self.ltp, self.ltd, exact = True)
+		self.clear_stats()
+	
+	# Oja's rule, dw = gamma * post * (pre - w * post)
+	def hebbian(self):
+		k = self.plastic
+		pre = self.rates(self.pre)[self.pre_idx[k]]
+		post = self.rates(self.post)[self.post_idx[k]]
+		w = self.w[k]
+		self.w[k] = w + self.gamma[k] * (post * (pre - w*post))
+	
+	def step_traces(self, dt):
+		pre_spike = self.spikes(self.pre)
+		post_spike = self.spikes(self.post)
+		self.x = self.x + dt*(-self.x/self.tau_p) + pre_spike
+		self.y = self.y + dt*(-self.y/self.tau_m) + post_spike
+		return pre_spike, post_spike
+	
+	# Soft bounded STDP, dw/dt = (1 - w)*eta_p*pre*x - w*eta_m*post*y
+	def stdp(self, dt):
+		pre_spike, post_spike = self.step_traces(dt)
+		self.update_weights(dt, pre_spike*self.x, post_spike*self.y)
+	
+	# ltp and ltd are each pre neuron's spikes times x and each post neuron's
+	# spikes times y, only synapses where either isn't 0 are changed. With
+	# exact the rule is integrated as dw/dt = eta_p*ltp - w*(eta_p*ltp +
+	# eta_m*ltd) over dt, otherwise it's a single Euler step.
+	def update_weights(self, dt, ltp, ltd, exact = False):
+		fired_pre = np.nonzero(ltp)[0]
+		fired_post = np.nonzero(ltd)[0]
+		if len(fired_pre) == 0 and len(fired_post) == 0:
+			return
+		syn_ltp = self.by_pre[expand_ranges(self.pre_ptr[fired_pre], self.pre_ptr[fired_pre + 1])]
+		syn_ltd = self.by_post[expand_ranges(self.post_ptr[fired_post], self.post_ptr[fired_post + 1])]
+		k = np.union1d(syn_ltp, syn_ltd)
+		k = k[self.mask[k]]
+		w = self.w[k]
+		if exact:
+			potentiate = dt*self.eta_p[k]*ltp[self.pre_idx[k]]
+			rate = potentiate + dt*self.eta_m[k]*ltd[self.post_idx[k]]
+			target = np.divide(potentiate, rate, out = w.copy(), where = rate > 0)
+			self.w[k] = target + (w - target)*np.exp(-rate)
+			return
+		A_p = (1 - w)*self.eta_p[k]
+		A_m = w*self.eta_m[k]
+		dwdt = A_p*ltp[self.pre_idx[k]] - A_m*ltd[self.post_idx[k]]
+		self.w[k] = w + dt*dwdt
@@ -0,0 +1,112 @@
+import os
+import sys
+import random
+import numpy as np
+import pytest
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(root, 'Orren'))
+from neuron import Neuron, RateWindow
+from plasticity import Projection
+import checkpoint
+from checkpointfile import read_meta
+
+# Projections of every kind that keep something between learning steps, all
+# sharing one RateWindow
+def orren_network():
+	random.seed(1)
+	window = RateWindow()
+	layers = []
+	for type, kwargs in [('hebbian', {}), ('hebbian', {'every': 7}), ('hebbian', {'on_flush': True}),
+							('stdp', {}), ('stdp', {'every': 9})]:
+		pre = [Neuron(isinput = True, type = type, window = window) for _ in range(20)]
+		post = [Neuron(type = type, window = window) for _ in range(15)]
+		for neuron in post:
+			for n_pre in pre:
+				if random.random() < 0.6:
+					neuron.add_syn(n_pre, w_init = random.random(), gamma = 0.001,
+									eta_p = 0.5, eta_m = 0.3)
+		layers.append((pre, post, Projection(pre, post, type = type, **kwargs)))
+	neurons = [neuron for pre, post, _ in layers for neuron in pre + post]
+	return layers, neurons, [proj for _, _, proj in layers]
+
+# Steps start to stop, with the same inputs for the same step every time
+def orren_train(layers, start, stop):
+	for s in range(start, stop):
+		rng = np.random.RandomState(s)
+		for pre, post, _ in layers:
+			for neuron in pre:
+				neuron.update(0.01, I_inj = 30*rng.rand()*(rng.rand() < 0.2))
+			for neuron in post:
+				neuron.update(0.01, learn = True)
+
+def same_state(a, b):
+	return set(a) == set(b) and all(np.array_equal(a[k], b[k]) and a[k].dtype == b[k].dtype for k in a)
+
+def test_orren_resume(tmp_path):
+	directory = str(tmp_path)
+	layers, neurons, projections = orren_network()
+	checkpointer = checkpoint.Checkpointer(directory, full_every = 3)
+	for s in range(0, 1200, 100):
+		orren_train(layers, s, s + 100)
+		checkpointer.save(checkpoint.network_state(neurons, projections), s + 100)
+	orren_train(layers, 1200, 1500)
+	expected = checkpoint.network_state(neurons, projections)
+	# The latest is stored against the full snapshot at 1000
+	assert checkpointer.checkpoints()[-1] == 'ckpt-0000001200.npz'
+	assert read_meta(os.path.join(directory, 'ckpt-0000001200.npz'))['base'] == 'ckpt-0000001000.npz'
+	for path in [None, os.path.join(directory, 'ckpt-0000001000.npz')]:
+		layers, neurons, projections = orren_network()
+		state, step = checkpoint.Checkpointer(directory, full_every = 3).load(path)
+		checkpoint.restore_network(state, neurons, projections)
+		orren_train(layers, step, 1500)
+		assert same_state(checkpoint.network_state(neurons, projections), expected)
+
+# samkg's network, two inputs through three layers with two teacher inputs
+def samkg_network(neuron):
+	random.seed(5)
+	inputs = neuron.NeuronLayer(number_neurons = 0)
+	currents = [neuron.InputNeuron() for _ in range(4)]
+	inputs.addNeuron(currents[0])
+	inputs.addNeuron(currents[1])
+	layers = [neuron.NeuronLayer(number_neurons = 2)]
+	layers.append(neuron.NeuronLayer(number_neurons = 3, previous_layer = layers[0]))
+	layers.append(neuron.NeuronLayer(number_neurons = 2, previous_layer = layers[1]))
+	for k in range(2):
+		layers[0].neurons[k].connectPreSynaptic(currents[k], weight = 1)
+		layers[2].neurons[k].connectPreSynaptic(currents[2 + k], weight = 1)
+	return [inputs] + layers, currents
+
+def samkg_train(layers, currents, start, stop):
+	cases = [[17, 17, 60, 0], [17, 39, 0, 60], [39, 17, 0, 60], [39, 39, 60, 0]]
+	for epoch in range(start, stop):
+		for current, value in zip(currents, cases[epoch % 4]):
+			current.current = value
+		for _ in range(200):
+			for layer in layers:
+				layer.step(0.01)
+		for layer in layers[1:]:
+			layer.train()
+		for layer in layers:
+			layer.resetEpoch()
+
+def test_samkg_resume(tmp_path):
+	pytest.importorskip('matplotlib')
+	sys.path.insert(0, root)
+	from samkg import neuron
+	from samkg import checkpoint as samkg_checkpoint
+	directory = str(tmp_path)
+	layers, currents = samkg_network(neuron)
+	checkpointer = samkg_checkpoint.Checkpointer(directory, fullEvery = 3)
+	for epoch in range(9):
+		samkg_train(layers, currents, epoch, epoch + 1)
+		checkpointer.save(samkg_checkpoint.networkState(layers), epoch + 1)
+	samkg_train(layers, currents, 9, 14)
+	expected = samkg_checkpoint.networkState(layers)
+	assert samkg_checkpoint.readMeta(os.path.join(directory, 'ckpt-0000000009.npz'))['base'] == 'ckpt-0000000007.npz'
+	for path in [None, os.path.join(directory, 'ckpt-0000000007.npz')]:
+		layers, currents = samkg_network(neuron)
+		state, epoch = samkg_checkpoint.Checkpointer(directory).load(path)
+		samkg_checkpoint.restoreNetwork(state, layers)
+		samkg_train(layers, currents, epoch, 14)
+		assert same_state(samkg_checkpoint.networkState(layers), expected)
@@ -0,0 +1,71 @@
+import os
+import sys
+import random
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Orren'))
+from neuron import Neuron, RateWindow
+from plasticity import Projection
+
+# A layer of input neurons driving a layer of learning neurons, the same
+# network every time for the same seed
+def network(type, seed = 1, gamma = 0.001):
+	random.seed(seed)
+	# Each layer keeps its hebbian rates in one window
+	pre_window = RateWindow()
+	post_window = RateWindow()
+	pre = [Neuron(isinput = True, type = type, window = pre_window) for _ in range(30)]
+	pre.append(Neuron(isteacher = True, type = type, window = pre_window))
+	post = [Neuron(type = type, window = post_window) for _ in range(20)]
+	post.append(Neuron(isteacher = True, type = type, window = post_window))
+	for neuron in post:
+		for n_pre in pre:
+			if random.random() < 0.6:
+				neuron.add_syn(n_pre, w_init = random.random(), gamma = gamma,
+								eta_p = random.random(), eta_m = 0.5*random.random(),
+								tau_p = 0.5, tau_m = 0.7)
+	return pre, post
+
+# Runs the network for steps, learning through a Projection if use_projection
+# or else synapse by synapse in Neuron.update, and returns the weights
+def run(type, use_projection, steps, gamma = 0.001, **kwargs):
+	pre, post = network(type, gamma = gamma)
+	if use_projection:
+		Projection(pre, post, type = type, **kwargs)
+	rng = np.random.RandomState(2)
+	for _ in range(steps):
+		for neuron in pre:
+			neuron.update(0.01, I_inj = 30*rng.rand()*(rng.rand() < 0.2))
+		for neuron in post:
+			neuron.update(0.01, learn = True)
+	return np.array([syn.w for neuron in post for syn in neuron.syns])
+
+def test_stdp_matches_synapses():
+	baseline = run('stdp', False, 1500)
+	assert np.array_equal(run('stdp', True, 1500), baseline)
+	# and the weights did change
+	assert not np.array_equal(run('stdp', False, 1), baseline)
+
+def test_hebbian_matches_synapses():
+	baseline = run('hebbian', False, 1500)
+	assert np.array_equal(run('hebbian', True, 1500), baseline)
+	assert not np.array_equal(run('hebbian', False, 1), baseline)
+
+def test_hebbian_every():
+	# Learning once over many flushes of changing rates, with a gamma small
+	# enough that the weights hardly feed back into the rates, sums up to
+	# nearly the same change as learning every step
+	start = run('hebbian', False, 0, gamma = 1e-6)
+	change = run('hebbian', False, 3000, gamma = 1e-6) - start
+	batched = run('hebbian', True, 3000, gamma = 1e-6, every = 3000) - start
+	assert np.abs(batched - change).max() < 0.05*np.abs(change).max()
+
+def test_private_windows():
+	# Neurons that aren't given a window don't share one, even with another dt
+	a = Neuron()
+	b = Neuron()
+	assert a.window is not b.window
+	for _ in range(600):
+		a.add_spike(1, 0.01)
+		b.add_spike(1, 0.02)
+	assert a.spike_rate > 0 and b.spike_rate > 0
@@ -0,0 +1,85 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+# Compiled versions of the kernels in kernels.py. Each one works on the
+# neurons (or traces, or postsynaptic rows) in [start, stop) and runs the
+# loop over them with prange, so the GIL is released for the whole step.
+# Every expression is evaluated in the same order as in kernels.py so both
+# give bit for bit the same results.
+from cython.parallel import prange
+
+compiled = True
+
+def lif_next(double[:, :] v, double[:, :] I_total, double[:] R_m, double[:] tau,
+			double[:] threshold, double dt, Py_ssize_t start, Py_ssize_t stop,
+			double[:, :] v_next, unsigned char[:, :] spiked):
+	cdef Py_ssize_t i, b, j
+	cdef Py_ssize_t batch = v.shape[0]
+	cdef double vi, dvdt
+	for i in prange(start, stop, nogil = True):
+		j = i - start
+		for b in range(batch):
+			vi = v[b, i]
+			dvdt = (-vi + R_m[i] * I_total[b, j])/tau[i]
+			vi = vi + dt*dvdt
+			v_next[b, j] = vi
+			spiked[b, j] = vi >= threshold[i]
+
+def lif_commit(double[:, :] v, double[:, :] vout, double[:, :] currspike, double[:] v_r,
+				double[:] threshold, double[:, :] v_next, unsigned char[:, :] spiked,
+				Py_ssize_t start, Py_ssize_t stop):
+	cdef Py_ssize_t i, b, j
+	cdef Py_ssize_t batch = v.shape[0]
+	for i in prange(start, stop, nogil = True):
+		j = i - start
+		for b in range(batch):
+			if spiked[b, j]:
+				v[b, i] = v_r[i]
+				vout[b, i] = threshold[i]
+				currspike[b, i] = 1
+			else:
+				v[b, i] = v_next[b, j]
+				vout[b, i] = v_next[b, j]
+				currspike[b, i] = 0
+
+def window_push(unsigned char[:, :, :] spikes, long long[:] pos, long long[:] length,
+				long long[:, :] count, unsigned char[:, :] spiked, Py_ssize_t start, Py_ssize_t stop):
+	cdef Py_ssize_t i, b, j, p
+	cdef Py_ssize_t batch = spikes.shape[0]
+	cdef Py_ssize_t window = spikes.shape[2]
+	cdef bint full
+	for i in prange(start, stop, nogil = True):
+		j = i - start
+		p = pos[i]
+		full = length[i] == window
+		for b in range(batch):
+			count[b, i] += spiked[b, j]
+			if full:
+				count[b, i] -= spikes[b, i, p]
+			spikes[b, i, p] = spiked[b, j]
+		pos[i] = (p + 1) % window
+		if not full:
+			length[i] += 1
+
+def trace_step(double[:, :] trace_I, double[:] trace_tau, long long[:] trace_pre,
+				double[:, :] currspike, long long[:] trace_steps, double dt,
+				Py_ssize_t start, Py_ssize_t stop):
+	cdef Py_ssize_t t, b
+	cdef Py_ssize_t batch = trace_I.shape[0]
+	cdef double I, dIdt
+	for t in prange(start, stop, nogil = True):
+		for b in range(batch):
+			I = trace_I[b, t]
+			dIdt = (-I/trace_tau[t]) + currspike[b, trace_pre[t]]
+			trace_I[b, t] = I + dt*dIdt
+		trace_steps[t] += 1
+
+def trace_rowsum(long long[:] indptr, double[:] data, long long[:] trace, double[:, :] trace_I,
+				double[:, :] out, Py_ssize_t start, Py_ssize_t stop):
+	cdef Py_ssize_t r, b, k
+	cdef Py_ssize_t batch = trace_I.shape[0]
+	cdef double total
+	for r in prange(start, stop, nogil = True):
+		for b in range(batch):
+			total = 0
+			for k in range(indptr[r], indptr[r + 1]):
+				total = total + data[k]*trace_I[b, trace[k]]
+			out[b, r] = total
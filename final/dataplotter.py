@@ -1,4 +1,5 @@
 import pygame
+import numpy as np
 from numpy import array as nparray
 from neuron import Neuron
 
@@ -46,9 +47,22 @@ class DynamicPlot(Frame):
 				return self.object.vs
 			elif self.var_interest == 'spikes':
 				return self.object.spikes
+	# Times and values of the trace being plotted along with the extents of
+	# the values, straight from the reader's ring buffer when it has one
+	def samples(self):
+		if hasattr(self.object, 'trace'):
+			trace = self.object.trace(self.var_interest)
+			if trace is None or len(trace) == 0:
+				return None
+			return trace.times(), trace.values(), trace.extents()
+		x_ax = np.asarray(self.x_axis(), dtype = float)
+		y_ax = np.asarray(self.y_axis(), dtype = float)
+		if len(x_ax) == 0 or len(y_ax) == 0:
+			return None
+		return x_ax, y_ax, [y_ax.min(), y_ax.max()]
 	def draw(self, screen):
 		pad = 20
-		resolution_x = self.fix_length // 5;
+		resolution_x = max(self.fix_length // 5, 1);
 		resolution_y = 10;
 		pygame.draw.rect(screen, (255,255,255), [self.pos[0], self.pos[1], self.scale_x, self.scale_y])
 		ratio_x = self.scale_x/screen.get_width();
@@ -65,37 +79,34 @@ class DynamicPlot(Frame):
 		pygame.draw.aaline(screen, (0, 0, 0), (y_axis_x, int(self.pos[1] + pad*ratio_y)),
 								(y_axis_x, int(self.pos[1] + self.scale_y - pad*ratio_y)))
 		
-		# The x and y axes
-		x_ax = self.x_axis()
-		y_ax = self.y_axis()
-		
-		# The length of the x and y axes
-		num_xs = len(x_ax)
-		num_ys = len(y_ax)
+		samples = self.samples()
 		
 		# If the axes are nonzero in size
-		if num_xs > 0 and num_ys > 0:
-		
+		if samples is not None:
+			x_ax, y_ax, y_ax_extents = samples
+			num_xs = min(len(x_ax), len(y_ax))
+			x_ax = x_ax[:num_xs]
+			y_ax = y_ax[:num_xs]
+			
 			# Function to normalize the data
-			def normalize(value, extents):
+			def normalize(values, extents):
 				if extents[0] == extents[1]:
-					return 1
-				return (value - extents[0])/(extents[1]-extents[0])
+					return np.ones(len(values))
+				return (values - extents[0])/(extents[1]-extents[0])
 			
-			# The bounds of the x axis
-			x_ax_extents = [min(x_ax),max(x_ax)]
+			# The bounds of the x axis, the samples are in time order
+			x_ax_extents = [x_ax[0], x_ax[-1]]
 			
 			# We set the y axis for spikes so that its normalized between 0 and 1
 			# Otherwise, just keep the extents bounded to the axes
-			if self.var_interest != 'spikes':
-				y_ax_extents = [min(y_ax),max(y_ax)]
-			else:
+			if self.var_interest == 'spikes':
 				y_ax_extents = [0,1]
 			
-			x_ax_plot = [normalize(x, x_ax_extents)*(self.scale_x - 2*pad*ratio_x) for x in x_ax]
-			y_ax_plot = [normalize(y, y_ax_extents)*(self.scale_y - 2*pad*ratio_y) for y in y_ax]
+			width = self.scale_x - 2*pad*ratio_x
+			x_ax_plot = normalize(x_ax, x_ax_extents)*width
+			y_ax_plot = normalize(y_ax, y_ax_extents)*(self.scale_y - 2*pad*ratio_y)
 			
-			dtick_x = (self.scale_x - 2*pad*ratio_x)/min(num_xs, resolution_x)
+			dtick_x = width/min(num_xs, resolution_x)
 			dtick_y = (self.scale_y - 2*pad*ratio_y)/resolution_y
 			ticklen = 5
 										
@@ -106,18 +117,40 @@ class DynamicPlot(Frame):
 				tick_y_extents = [[int(e[0]),int(e[1])] for e in tick_y_extents]
 				pygame.draw.aaline(screen, (0,0,0),  tick_y_extents[0], tick_y_extents[1])
 				
-			for i in range(num_xs):
-				if(num_xs < resolution_x or i // resolution_x == 0):
-					pos_tick_x = nparray([dtick_x*i + pad*ratio_x, x_axis_y])
-					tick_x_offset = nparray([0, ticklen*ratio_y])
-					tick_x_extents = [pos_tick_x - tick_x_offset, pos_tick_x + tick_x_offset]
-					tick_x_extents = [[int(e[0]),int(e[1])] for e in tick_x_extents]
-					pygame.draw.aaline(screen, (0,0,0),  tick_x_extents[0], tick_x_extents[1])
-				
-				if self.var_interest == 'spikes':
-					pygame.draw.aaline(screen, (255,0,0), (x_ax_plot[i] + self.pos[0] + pad*ratio_x, x_axis_y),
-										(x_ax_plot[i] + self.pos[0], y_ax_plot[i]/2 + self.pos[1]))
-				elif i < num_xs-1:
-					pygame.draw.aaline(screen, (255,0,0), (x_ax_plot[i] + self.pos[0] + pad*ratio_y, y_ax_plot[i]/2 + self.pos[1]),
-										(x_ax_plot[i+1] + self.pos[0], y_ax_plot[i+1]/2 + self.pos[1]))
-	
\ No newline at end of file
+			for i in range(min(num_xs, resolution_x)):
+				pos_tick_x = nparray([dtick_x*i + pad*ratio_x, x_axis_y])
+				tick_x_offset = nparray([0, ticklen*ratio_y])
+				tick_x_extents = [pos_tick_x - tick_x_offset, pos_tick_x + tick_x_offset]
+				tick_x_extents = [[int(e[0]),int(e[1])] for e in tick_x_extents]
+				pygame.draw.aaline(screen, (0,0,0),  tick_x_extents[0], tick_x_extents[1])
+			
+			# No point drawing more than a couple of samples per pixel column,
+			# so long traces are cut down to the min and max of every column
+			x_ax_plot, y_ax_plot = decimate(x_ax_plot, y_ax_plot, int(width))
+			xs = x_ax_plot + self.pos[0] + pad*ratio_x
+			ys = y_ax_plot/2 + self.pos[1]
+			if self.var_interest == 'spikes':
+				# Every stem goes up from the axis and back down to it, and the
+				# stems are joined along the axis, so they're one polyline
+				if len(xs):
+					base = np.stack([xs, np.full(len(xs), float(x_axis_y))], axis = 1)
+					top = np.stack([xs - pad*ratio_x, ys], axis = 1)
+					points = np.stack([base, top, base], axis = 1).reshape(-1, 2)
+					pygame.draw.aalines(screen, (255,0,0), False, points.tolist())
+			elif len(xs) > 1:
+				pygame.draw.aalines(screen, (255,0,0), False, np.stack([xs, ys], axis = 1).tolist())
+
+# Cuts a trace down to the minimum and maximum of every pixel column it
+# covers, once there are more samples than that would leave
+def decimate(x, y, width):
+	if width <= 0 or len(x) <= 2*width:
+		return x, y
+	span = x[-1] - x[0]
+	if span > 0:
+		column = ((x - x[0]) / span * (width - 1)).astype(np.int64)
+	else:
+		column = np.zeros(len(x), dtype = np.int64)
+	starts = np.concatenate([[0], np.nonzero(np.diff(column))[0] + 1])
+	lo = np.minimum.reduceat(y, starts)
+	hi = np.maximum.reduceat(y, starts)
+	return np.repeat(x[starts], 2), np.stack([lo, hi], axis = 1).ravel()
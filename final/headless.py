@@ -0,0 +1,101 @@
+import time
+import argparse
+import multiprocessing
+import numpy as np
+from retina import Retina
+
+# Runs MNIST images through the retina without a display and saves the mean
+# firing rate of every neuron in every layer while each image was shown.
+#
+#     python headless.py --start 0 --count 10000 --duration 1 --out rates.npz
+#
+# Images are split into batches that are run as one batched network each, and
+# the batches are shared out between worker processes.
+
+# Layers in the output file, one rate map per image each
+layer_names = ['oncoffs', 'offcons', 'vertical', 'horizontal', 'diagonal_lr', 'diagonal_rl', 'output']
+
+sinusoidchoice = {"horizontal":True, "vertical":True, "diagonal_lr":False, "diagonal_rl":False}
+
+retina = None
+options = None
+
+def init_worker(opts):
+	global retina, options
+	options = opts
+	# The rates are worked out from spike counts, so the cheap EMA estimator
+	# saves keeping a spike window for every neuron in the batch
+	retina = Retina(batch = opts['batch'], nneurons = opts['nneurons'], pop = opts['pop'],
+					block_size = opts['block_size'], sinusoidchoice = sinusoidchoice,
+					rate_estimator = 'ema', event_driven = True, cache = opts['cache'])
+
+# Shows every image in images for the whole duration and returns the firing
+# rate maps, as the fraction of time steps each neuron spiked in
+def run_batch(images):
+	n = len(images)
+	nneurons = options['nneurons']
+	retina.reset(n)
+	layers = [retina.oncoffs_pop, retina.offcons_pop, retina.line_detectors_pop, retina.output_pop]
+	counts = [np.zeros((n, layer.size)) for layer in layers]
+	nsteps = int(round(options['duration']/options['dt']))
+	for _ in range(nsteps):
+		retina.step(options['dt'], images)
+		for count, layer in zip(counts, layers):
+			count += layer.currspike[:, :layer.size]
+	rates = [(count/max(nsteps, 1)).astype(np.float32) for count in counts]
+	oncoffs, offcons, detectors, output = [rate.reshape(n, nneurons, nneurons, -1) for rate in rates]
+	# Line detectors are stored v, h, dlr, drl for every grid position
+	return [oncoffs[..., 0], offcons[..., 0]] + [detectors[..., k] for k in range(4)] + [output[..., 0]]
+
+def main():
+	parser = argparse.ArgumentParser(description = "Run MNIST test images through the retina without a display")
+	parser.add_argument('--start', type = int, default = 0, help = "index of the first image")
+	parser.add_argument('--count', type = int, default = 100, help = "number of images")
+	parser.add_argument('--train', action = 'store_true', help = "use the training set instead of the test set")
+	parser.add_argument('--duration', type = float, default = 1.0, help = "simulated time each image is shown for")
+	parser.add_argument('--dt', type = float, default = 0.01, help = "time step")
+	parser.add_argument('--batch', type = int, default = 32, help = "images run together in one network")
+	parser.add_argument('--workers', type = int, default = multiprocessing.cpu_count(), help = "worker processes")
+	parser.add_argument('--pop', type = int, default = 10, help = "population factor")
+	parser.add_argument('--block-size', type = int, default = 3, help = "line detector block size")
+	parser.add_argument('--cache', default = "network_cache", help = "compiled network cache directory")
+	parser.add_argument('--out', default = "rates.npz", help = "output file")
+	args = parser.parse_args()
+	
+	import mnist_loader
+	kind = 'training' if args.train else 'testing'
+	images = mnist_loader.get_numpy_array(args.count, start = args.start, kind = kind).astype(np.float32)
+	labels = np.array(mnist_loader.load(kind).labels[args.start:args.start + len(images)])
+	opts = {'nneurons': images.shape[1], 'pop': args.pop, 'block_size': args.block_size,
+			'duration': args.duration, 'dt': args.dt, 'batch': args.batch, 'cache': args.cache}
+	
+	# Build (or check) the cache once here so the workers can all load it
+	Retina(nneurons = opts['nneurons'], pop = args.pop, block_size = args.block_size,
+			sinusoidchoice = sinusoidchoice, cache = args.cache)
+	
+	batches = [images[i:i + args.batch] for i in range(0, len(images), args.batch)]
+	maps = [np.zeros(images.shape, dtype = np.float32) for _ in layer_names]
+	t0 = time.time()
+	done = 0
+	if args.workers > 1:
+		workers = multiprocessing.Pool(args.workers, initializer = init_worker, initargs = (opts,))
+		results = workers.imap(run_batch, batches)
+	else:
+		init_worker(opts)
+		workers = None
+		results = map(run_batch, batches)
+	for result in results:
+		for layer_map, rate in zip(maps, result):
+			layer_map[done:done + len(rate)] = rate
+		done += len(result[0])
+		print("%d/%d images, %.1fs" % (done, len(images), time.time() - t0))
+	if workers is not None:
+		workers.close()
+		workers.join()
+	
+	np.savez_compressed(args.out, indices = np.arange(args.start, args.start + len(images)),
+						labels = labels, dt = args.dt, duration = args.duration,
+						**dict(zip(layer_names, maps)))
+
+if __name__ == "__main__":
+	main()
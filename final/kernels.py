@@ -0,0 +1,64 @@
+import numpy as np
+
+# The inner loops of a simulation step over array-backed neuron and synapse
+# state. Each kernel works on the neurons (or traces, or postsynaptic rows) in
+# [start, stop) and writes its results into the arrays it is given.
+#
+# These are the NumPy versions. `make kernels` builds _kernels.pyx, the typed
+# Cython versions that run without the GIL, and when it's there it replaces
+# everything below. Both do the arithmetic in the same order, so switching
+# between them doesn't change the results.
+compiled = False
+
+# Leaky integrate and fire update. v_next and spiked get the new membrane
+# potential and whether it crossed threshold, relative to start.
+def lif_next(v, I_total, R_m, tau, threshold, dt, start, stop, v_next, spiked):
+	vi = v[:, start:stop]
+	dvdt = (-vi + R_m[start:stop] * I_total)/tau[start:stop]
+	vi = vi + dt*dvdt
+	v_next[...] = vi
+	spiked[...] = vi >= threshold[start:stop]
+
+# Writes out a step worked out by lif_next, resetting the neurons that spiked
+def lif_commit(v, vout, currspike, v_r, threshold, v_next, spiked, start, stop):
+	spiked = spiked.astype(bool)
+	v[:, start:stop] = np.where(spiked, v_r[start:stop], v_next)
+	vout[:, start:stop] = np.where(spiked, threshold[start:stop], v_next)
+	currspike[:, start:stop] = spiked
+
+# Pushes one step of spikes into a SpikeWindow's ring buffer, keeping the
+# running spike counts up to date
+def window_push(spikes, pos, length, count, spiked, start, stop):
+	window = spikes.shape[2]
+	rows = np.arange(start, stop)
+	p = pos[start:stop]
+	full = length[start:stop] == window
+	count[:, start:stop] += spiked.astype(np.int64) - full*spikes[:, rows, p]
+	spikes[:, rows, p] = spiked
+	pos[start:stop] = (p + 1) % window
+	length[start:stop] = np.minimum(length[start:stop] + 1, window)
+
+# One Euler step of the shared synaptic current traces
+def trace_step(trace_I, trace_tau, trace_pre, currspike, trace_steps, dt, start, stop):
+	I = trace_I[:, start:stop]
+	dIdt = (-I/trace_tau[start:stop]) + currspike[:, trace_pre[start:stop]]
+	trace_I[:, start:stop] = I + dt*dIdt
+	trace_steps[start:stop] += 1
+
+# Weighted sum of the traces feeding every postsynaptic row of a CSR
+# projection. The synapses of each row are added one after another, going
+# across all rows at once, which is the same order the compiled loop uses.
+def trace_rowsum(indptr, data, trace, trace_I, out, start, stop):
+	starts = indptr[start:stop]
+	counts = indptr[start + 1:stop + 1] - starts
+	total = np.zeros((trace_I.shape[0], stop - start))
+	for k in range(counts.max() if len(counts) > 0 else 0):
+		rows = np.nonzero(counts > k)[0]
+		pos = starts[rows] + k
+		total[:, rows] = total[:, rows] + data[pos]*trace_I[:, trace[pos]]
+	out[:, start:stop] = total
+
+try:
+	from _kernels import *
+except ImportError:
+	pass
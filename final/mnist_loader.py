@@ -1,31 +1,90 @@
 import numpy as np
 import os.path
+import gzip
+import struct
 NUM_SAMPLES = 100 # number of samples to include <= 10000
 
-from mnist import MNIST
-mndata = MNIST(os.path.abspath('dataset'))
-images,labels = mndata.load_testing()
+# MNIST straight from the IDX files in dataset/, memory mapped so that only
+# the images actually used are ever read. Nothing is opened until the images
+# or labels are first asked for. Falls back to the .gz files if that's all
+# there is, which have to be read in whole.
 
-# Get a numpy array of images
-def get_numpy_array(num_samples=NUM_SAMPLES):
-    arr = []
-    for i in range(0,num_samples):
-        image = []
-        row = []
-        for j in range(0,len(images[i])):
-            pixl = images[i][j]
-            #print(pixl)
-            if pixl == 0:
-                row.append(0)
-            else:
-                row.append(1)
-            if j%28 == 27 and len(row) > 0 :
-                image.append(row)
-                row = []
-        arr.append(np.array(image))
-        #print(len(image))
-    #print('retrieved',len(arr))
-    return arr
+FILES = {'testing': ('t10k-images-idx3-ubyte', 't10k-labels-idx1-ubyte'),
+         'training': ('train-images-idx3-ubyte', 'train-labels-idx1-ubyte')}
+
+# Looked for in the working directory first, then next to this file
+SEARCH_PATHS = [os.path.abspath('dataset'),
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dataset')]
+
+def find_file(name):
+    for path in SEARCH_PATHS:
+        for candidate in (os.path.join(path, name), os.path.join(path, name + '.gz')):
+            if os.path.isfile(candidate):
+                return candidate
+    raise IOError("Couldn't find %s in %s" % (name, ', '.join(SEARCH_PATHS)))
+
+# Returns the array stored in an IDX file, e.g. (N, 28, 28) for images
+def read_idx(filename):
+    if filename.endswith('.gz'):
+        with gzip.open(filename, 'rb') as f:
+            data = f.read()
+        magic, = struct.unpack('>I', data[:4])
+        ndim = magic & 0xff
+        shape = struct.unpack('>' + 'I'*ndim, data[4:4 + 4*ndim])
+        return np.frombuffer(data, dtype = np.uint8, offset = 4 + 4*ndim).reshape(shape)
+    with open(filename, 'rb') as f:
+        magic, = struct.unpack('>I', f.read(4))
+        ndim = magic & 0xff
+        shape = struct.unpack('>' + 'I'*ndim, f.read(4*ndim))
+    if (magic >> 8) != 0x08:
+        raise IOError("%s isn't an unsigned byte IDX file" % filename)
+    return np.memmap(filename, dtype = np.uint8, mode = 'r', offset = 4 + 4*ndim, shape = shape)
+
+class Dataset:
+    def __init__(self, kind = 'testing'):
+        self.kind = kind
+        self._images = None
+        self._labels = None
+
+    # (N, 28, 28) uint8 view of every image
+    @property
+    def images(self):
+        if self._images is None:
+            self._images = read_idx(find_file(FILES[self.kind][0]))
+        return self._images
+
+    @property
+    def labels(self):
+        if self._labels is None:
+            self._labels = read_idx(find_file(FILES[self.kind][1]))
+        return self._labels
+
+    def __len__(self):
+        return len(self.labels)
+
+datasets = {}
+
+def load(kind = 'testing'):
+    if kind not in datasets:
+        datasets[kind] = Dataset(kind)
+    return datasets[kind]
+
+# The old module level images and labels, loaded the first time they're used
+def __getattr__(name):
+    if name in ('images', 'labels'):
+        return getattr(load('testing'), name)
+    raise AttributeError(name)
+
+# Turns raw images into network input, either 1 wherever a pixel is above
+# threshold and 0 elsewhere, or the pixel intensity scaled to 0..1
+def encode(images, mode = 'binary', threshold = 0):
+    if mode == 'intensity':
+        return images / 255.0
+    return (np.asarray(images) > threshold).astype(np.int64)
+
+# Get a numpy array of images, num_samples of them starting at start
+def get_numpy_array(num_samples=NUM_SAMPLES, start = 0, kind = 'testing', mode = 'binary', threshold = 0):
+    return encode(load(kind).images[start:start + num_samples], mode, threshold)
 
 # get an array of smaller testcases
 def get_testcase():
@@ -39,4 +98,4 @@ def get_testcase():
 if __name__ == "__main__":
     print('run test')
     images = get_numpy_array()
-    print(images[0],len(images),len(images[0]),len(images[0][0]))
\ No newline at end of file
+    print(images[0],len(images),len(images[0]),len(images[0][0]))
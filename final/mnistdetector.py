@@ -1,26 +1,23 @@
 import pygame
-import os
-import subprocess
 import math
 import random
-import timemodule
 from neuron import *
-from neurongraphics import NeuronG
+from neurongraphics import NeuronG, NeuronLayer, SynapseLayer
 from neurontopixel import *
+from retina import Retina
+from simulation import Simulation
+from workerpool import WorkerPool
+from recorder import Recorder, next_recording
 import mnist_loader
 from dataplotter import DynamicPlot
 import numpy as np
 import threading
 from cython.parallel import prange, parallel
 import multiprocessing
-from concurrent.futures import *
 # Color constant for black
 BLACK = (0,0,0)
 WHITE = (255,255,255)
 
-def within_bounds(x, x_l, x_r):
-	return x >= x_l and x <= x_r
-
 class Label:
 	def __init__(self, labels, init_idx=0):
 		self.font = pygame.font.SysFont("Segoe UI", 65)
@@ -58,28 +55,11 @@ class Label:
 
 pygame.init()
 
-# Making the directory for storing frames
-frame_dir = "frames"
-try:
-	os.makedirs(frame_dir)
-except FileExistsError:
-	filestoremove = [os.path.abspath(os.path.join(frame_dir, f)) 
-		for f in os.listdir(frame_dir) 
-		if os.path.isfile(os.path.join(frame_dir, f))]
-	for f in filestoremove:
-		os.remove(f)
-
-curr_recording_idx = 0	
-# Making the directory for the video
-record_dir = "recordings"
-try:
-	os.makedirs(record_dir)
-except FileExistsError:
-	videofiles = [f for f in os.listdir(record_dir)
-					if (os.path.isfile(os.path.join(record_dir, f)) and f != ".gitignore")]
-	if not (not videofiles):
-		vfnums = [int(os.path.splitext(vf)[0]) for vf in videofiles]
-		curr_recording_idx = max(vfnums)+1
+# Recording mode, "pipe" streams frames straight into ffmpeg and "png" saves
+# a PNG per frame and puts the video together on exit
+RECORD_MODE = "pipe"
+# Frames waiting to be written before new ones get dropped
+RECORD_QUEUE = 64
 
 # Constant for whether to draw neurons
 DRAW_NEURONS = True
@@ -100,9 +80,15 @@ done = False
 # Time stuff for neuron updating
 dt = 0.01
 timescale = 4
-newtimestep = dt*timescale
+framerate = 20
 
-nclock = timemodule.Clock(dt)
+# The network is stepped on its own thread. "realtime" runs one simulated
+# second per second, "ratio" SIM_RATIO simulated seconds per second and
+# "fast" as fast as it can, whatever the frame rate turns out to be. The ratio
+# is the pace the frame loop used to step at, dt*timescale every frame.
+SIM_MODE = "ratio"
+SIM_RATIO = dt*timescale*framerate
+sim_modes = ["realtime", "ratio", "fast"]
 
 # Getting the MNIST images for the photoreceptive layer
 allimages = mnist_loader.get_numpy_array()
@@ -121,18 +107,40 @@ scale = 20/(ssize/float(spacing))*scalefactor
 # Input grid
 inputgrid = PixelGrid(currimg, threshold = None, screen_width = ssize)
 
+# Population factor
+pop = 10
+
+# Constant for line detecting ganglion cells
+BLOCK_SIZE = 3
+# Step every layer from the previous tick's spikes instead of in layer order
+SYNCHRONOUS = False
+
+sinusoidchoice = {"horizontal":True, "vertical":True, "diagonal_lr":False, "diagonal_rl":False}
+
+# Worker threads stay alive for the whole run and are shared by every layer.
+# A single 28x28 image is too little work to split up within a layer, so the
+# threads only help when the layers are stepped side by side.
+pool = WorkerPool(workers = multiprocessing.cpu_count()) if SYNCHRONOUS else None
+
+# The network itself, every layer is advanced in one vectorized step
+retina = Retina(nneurons = nneurons, pop = pop, block_size = BLOCK_SIZE,
+				sinusoidchoice = sinusoidchoice, event_driven = True,
+				synchronous = SYNCHRONOUS, pool = pool, cache = "network_cache")
+
+sim = Simulation(retina, dt, currimg, mode = SIM_MODE, ratio = SIM_RATIO)
+
+custom_color = lambda val : (val, 255-val, 0)
+
+# Everything below just places views onto the retina's neurons on screen
+
 # photoreceptive layer
 for i in range(0, neuronrows):
 	row = []
 	for j in range(0, neuroncols):
-		row.append(NeuronG(((j+1)*spacing,(i+1)*spacing), scale = scale, is_input = True))
+		row.append(NeuronG(((j+1)*spacing,(i+1)*spacing), scale = scale,
+							population = retina.photoreceptors, index = i*neuroncols + j))
 	neurongrid.append(row)
 
-custom_color = lambda val : (val, 255-val, 0)
-
-# Population factor
-pop = 10
-
 # Bipolar cells: On center off surround and on center off surround
 oncoffs = []
 offcons = []
@@ -140,49 +148,14 @@ for i in range(0, neuronrows):
 	oncoffsrow = []
 	offconsrow = []
 	for j in range(0, neuroncols):
-		newoncoffs = NeuronG(neurongrid[i][j].pos+(5,5), scale = scale, custom_color = custom_color)
-		oncoffsrow.append(newoncoffs)
-		newoffcons = NeuronG(neurongrid[i][j].pos+(5,5), scale = scale, custom_color = custom_color)
-		offconsrow.append(newoffcons)
-		# On center
-		newoncoffs.add_syn(neurongrid[i][j],
-								w_init = 1*pop, tau = 2, sign=1)
-		# Off center
-		newoffcons.add_syn(neurongrid[i][j],
-							w_init = 1*pop, tau = 1, sign=-1)
-		
-		rotation_1 = 1 + 1j
-		rotation_2 = 1
-		for _ in range(4):
-			curr_i = int(rotation_1.imag) + i
-			curr_j = int(rotation_1.real) + j
-			if within_bounds(curr_i, 0, neuronrows-1) and within_bounds(curr_j, 0, neuroncols-1):
-				# Off surround
-				newoncoffs.add_syn(neurongrid[curr_i][curr_j],
-									w_init = 0.02*pop, sign=-1)
-				# On surround
-				newoffcons.add_syn(neurongrid[curr_i][curr_j],
-									w_init = 0.02*pop, sign=1)				
-			curr_i = int(rotation_2.imag) + i
-			curr_j = int(rotation_2.real) + j
-			if within_bounds(curr_i, 0, neuronrows-1) and within_bounds(curr_j, 0, neuroncols-1):
-				# Off surround
-				newoncoffs.add_syn(neurongrid[curr_i][curr_j],
-									w_init = 0.1*pop, sign=-1)
-				# On surround
-				newoffcons.add_syn(neurongrid[curr_i][curr_j],
-									w_init = 0.2*pop, sign=1)
-				rotation_1 *= 1j
-				rotation_2 *= 1j
-			
+		oncoffsrow.append(NeuronG(neurongrid[i][j].pos+(5,5), scale = scale, custom_color = custom_color,
+								population = retina.oncoffs_pop, index = i*neuroncols + j))
+		offconsrow.append(NeuronG(neurongrid[i][j].pos+(5,5), scale = scale, custom_color = custom_color,
+								population = retina.offcons_pop, index = i*neuroncols + j))
 	oncoffs.append(oncoffsrow)
 	offcons.append(offconsrow)
 
-# Constant for line detecting ganglion cells
-BLOCK_SIZE = 3	
-
-# Line detecting ganglion cells
-# each neuron is responsible for detecting its own 3x3 block of on-center off-surround cells surrounding the neuron
+# Line detecting ganglion cells, one for every orientation
 line_detectors = []
 line_detectors_v = []
 line_detectors_h = []
@@ -190,224 +163,55 @@ line_detectors_dlr = []
 line_detectors_drl = []
 for i in range(0,neuronrows):
 	row = []
-	verts = []
-	horzs = []
-	diags_lr = [] # top left to bottom right diagonal
-	diags_rl = [] # top right to bottom left diagonal
 	for j in range(0,neuroncols):
 		top_i = i - BLOCK_SIZE//2
-		bottom_i = i + BLOCK_SIZE//2
 		left_j = j - BLOCK_SIZE//2
-		right_j = j + BLOCK_SIZE//2
 		pos1 = np.array(oncoffs[i][j].pos)
 		pos2 = np.array(oncoffs[top_i][left_j].pos)
-
-		## Initialize neurons (one for every orientation)
-		vert = NeuronG(pos = pos1 + (pos2 - pos1)/4,scale = scale,custom_color = custom_color)
-		horz = NeuronG(pos = pos1 + (pos2 - pos1)/2,scale = scale,custom_color = custom_color)
-		diag_lr = NeuronG(pos = pos1 - (pos2 - pos1)/16,scale = scale,custom_color = custom_color)
-		diag_rl = NeuronG(pos = pos1 - (pos2 - pos1)/8,scale = scale,custom_color = custom_color)
-
-		## Add synapses
-		# 1) vertical line detector
-		for d in range(0,BLOCK_SIZE*BLOCK_SIZE):
-			tmp_i = top_i + (d//BLOCK_SIZE)
-			tmp_j = left_j + (d%BLOCK_SIZE)
-			if (tmp_i >= 0 and tmp_i < nneurons) and (tmp_j >= 0 and tmp_j < nneurons):
-				if tmp_j == j:
-					# we lie on vertical line
-					vert.add_syn(oncoffs[tmp_i][tmp_j],tau=2,w_init=0.5*pop) #excite with on
-					vert.add_syn(offcons[tmp_i][tmp_j],tau=2,w_init=-0.5*pop) #inhibit off
-				else:
-					vert.add_syn(oncoffs[tmp_i][tmp_j],tau=2,w_init=-0.2*pop) #inhibit when on
-					vert.add_syn(offcons[tmp_i][tmp_j],tau=2,w_init=-0.2*pop) #excite when off
-		
-		# 2) Horizontal line detector
-		for d in range(0,BLOCK_SIZE*BLOCK_SIZE):
-			tmp_i = top_i + (d//BLOCK_SIZE)
-			tmp_j = left_j + (d%BLOCK_SIZE)
-			if (tmp_i >= 0 and tmp_i < nneurons) and (tmp_j >= 0 and tmp_j < nneurons):
-				if tmp_i == i:
-					# we lie on horizontal line
-					horz.add_syn(oncoffs[tmp_i][tmp_j],tau=2,w_init=0.5*pop) #excite with on
-					horz.add_syn(offcons[tmp_i][tmp_j],tau=2,w_init=-0.5*pop) #inhibit off
-				else:
-					horz.add_syn(oncoffs[tmp_i][tmp_j],tau=2,w_init=-0.2*pop) #inhibit when on
-					horz.add_syn(offcons[tmp_i][tmp_j],tau=2,w_init=-0.2*pop) #excite when off
-		
-		# 3) Diagonal from left to right
-		for d in range(0,BLOCK_SIZE*BLOCK_SIZE):
-			tmp_i = top_i + (d//BLOCK_SIZE)
-			tmp_j = left_j + (d%BLOCK_SIZE)
-			if (tmp_i >= 0 and tmp_i < nneurons) and (tmp_j >= 0 and tmp_j < nneurons):
-				if abs(top_i - tmp_i) == abs(left_j - tmp_j):
-					# we lie on l-r diagonal (if distance to topleft corner is same in both x and y)
-					diag_lr.add_syn(oncoffs[tmp_i][tmp_j],tau=2,w_init=0.5*pop) #excite with on
-					diag_lr.add_syn(offcons[tmp_i][tmp_j],tau=2,w_init=-0.5*pop) #inhibit off
-				else:
-					diag_lr.add_syn(oncoffs[tmp_i][tmp_j],tau=2,w_init=-0.2*pop) #inhibit when on
-					diag_lr.add_syn(offcons[tmp_i][tmp_j],tau=2,w_init=-0.2*pop) #excite when off
-
-		# 4) Diagonal from right to left
-		for d in range(0,BLOCK_SIZE*BLOCK_SIZE):
-			tmp_i = top_i + (d//BLOCK_SIZE)
-			tmp_j = left_j + (d%BLOCK_SIZE)
-			if (tmp_i >= 0 and tmp_i < nneurons) and (tmp_j >= 0 and tmp_j < nneurons):
-				if abs(bottom_i - tmp_i) == abs(left_j - tmp_j):
-					# we lie on l-r diagonal (if distance to topleft corner is same in both x and y)
-					diag_rl.add_syn(oncoffs[tmp_i][tmp_j],tau=2,w_init=0.5*pop) #excite with on
-					diag_rl.add_syn(offcons[tmp_i][tmp_j],tau=2,w_init=-0.5*pop) #inhibit off
-				else:
-					diag_rl.add_syn(oncoffs[tmp_i][tmp_j],tau=2,w_init=-0.2*pop) #inhibit when on
-					diag_rl.add_syn(offcons[tmp_i][tmp_j],tau=2,w_init=-0.2*pop) #excite when off
-
-		row.append(vert)
-		row.append(horz)
-		row.append(diag_lr)
-		row.append(diag_rl)
-		horzs.append(horz)
-		verts.append(vert)
-		diags_lr.append(diag_lr)
-		diags_rl.append(diag_rl)
-
+		offsets = [(pos2 - pos1)/4, (pos2 - pos1)/2, -(pos2 - pos1)/16, -(pos2 - pos1)/8]
+		for k in range(4):
+			row.append(NeuronG(pos = pos1 + offsets[k],scale = scale,custom_color = custom_color,
+								population = retina.line_detectors_pop,
+								index = 4*(i*neuroncols + j) + k))
 	line_detectors.append(row)
-	line_detectors_h.append(horzs)
-	line_detectors_v.append(verts)
-	line_detectors_dlr.append(diags_lr)
-	line_detectors_drl.append(diags_rl)
+	line_detectors_v.append(row[0::4])
+	line_detectors_h.append(row[1::4])
+	line_detectors_dlr.append(row[2::4])
+	line_detectors_drl.append(row[3::4])
 
 # Mapping back to the photoreceptive layer
 output_layer = []
 for i in range(0,neuronrows):
 	row = []
 	for j in range(0,neuroncols):
-		outp = NeuronG(neurongrid[i][j].pos+(5,5), scale = scale, custom_color = custom_color)
-		row.append(outp)
-		outp.add_syn(neurongrid[i][j],tau=1,w_init=1) # compose input layer
+		row.append(NeuronG(neurongrid[i][j].pos+(5,5), scale = scale, custom_color = custom_color,
+							population = retina.output_pop, index = i*neuroncols + j))
 	output_layer.append(row)
 
-	
-sinusoidchoice = {"horizontal":True, "vertical":True, "diagonal_lr":False, "diagonal_rl":False}
-
-# Horizontal
-if sinusoidchoice["horizontal"]:
-	for i in range(0,neuronrows):
-		row = []
-		for j in range(0,neuroncols):
-			hneuron = line_detectors_h[i][j]
-			top_i = i - BLOCK_SIZE//2
-			bottom_i = i + BLOCK_SIZE//2
-			left_j = j - BLOCK_SIZE//2
-			right_j = j + BLOCK_SIZE//2
-			for d in range(0,BLOCK_SIZE*BLOCK_SIZE):
-				tmp_i = top_i + (d//BLOCK_SIZE)
-				tmp_j = left_j + (d%BLOCK_SIZE)
-				if (tmp_i >= 0 and tmp_i < nneurons) and (tmp_j >= 0 and tmp_j < nneurons):
-					if j%3 == 1 and (d == 3 or d == 1 or d == 5):
-						output_layer[tmp_i][tmp_j].add_syn(hneuron,tau=1,w_init=1*pop)
-					elif j%3 == 2 and (d == 0 or d == 4 or d == 8):
-						output_layer[tmp_i][tmp_j].add_syn(hneuron,tau=1,w_init=1*pop)
-					elif j%3 == 0 and (d == 3 or d == 7 or d == 5):
-						output_layer[tmp_i][tmp_j].add_syn(hneuron,tau=1,w_init=1*pop)
-					else: 
-						output_layer[tmp_i][tmp_j].add_syn(hneuron,tau=1,w_init=-0.1*pop)
-
-# Vertical
-if sinusoidchoice["vertical"]:
-	for i in range(0,neuronrows):
-		row = []
-		for j in range(0,neuroncols):
-			vneuron = line_detectors_v[i][j]
-			top_i = i - BLOCK_SIZE//2
-			bottom_i = i + BLOCK_SIZE//2
-			left_j = j - BLOCK_SIZE//2
-			right_j = j + BLOCK_SIZE//2
-			for d in range(0,BLOCK_SIZE*BLOCK_SIZE):
-				tmp_i = top_i + (d//BLOCK_SIZE)
-				tmp_j = left_j + (d%BLOCK_SIZE)
-				if (tmp_i >= 0 and tmp_i < nneurons) and (tmp_j >= 0 and tmp_j < nneurons):
-					if i%3 == 1 and (d == 1 or d == 3 or d == 7):
-						output_layer[tmp_i][tmp_j].add_syn(vneuron,tau=1,w_init=0.9*pop)
-					elif i%3 == 2 and (d == 0 or d == 4 or d == 8):
-						output_layer[tmp_i][tmp_j].add_syn(vneuron,tau=1,w_init=0.9*pop)
-					elif i%3 == 3 and (d == 1 or d == 3 or d == 5):
-						output_layer[tmp_i][tmp_j].add_syn(vneuron,tau=1,w_init=0.9*pop)
-					else: 
-						output_layer[tmp_i][tmp_j].add_syn(vneuron,tau=1,w_init=-0.1*pop)					
-
-# LR-Diagonal
-if sinusoidchoice["diagonal_lr"]:
-	for i in range(0,neuronrows):
-		row = []
-		for j in range(0,neuroncols):
-			dneuron = line_detectors_dlr[i][j]
-			top_i = i - BLOCK_SIZE//2
-			bottom_i = i + BLOCK_SIZE//2
-			left_j = j - BLOCK_SIZE//2
-			right_j = j + BLOCK_SIZE//2
-			for d in range(0,BLOCK_SIZE*BLOCK_SIZE):
-				tmp_i = top_i + (d//BLOCK_SIZE)
-				tmp_j = left_j + (d%BLOCK_SIZE)
-				if (tmp_i >= 0 and tmp_i < nneurons) and (tmp_j >= 0 and tmp_j < nneurons):
-					if i == j and i%2 == 1 and (d == 0 or d == 4 or d == 6 or d == 7 or d == 8):
-						output_layer[tmp_i][tmp_j].add_syn(dneuron,tau=1,w_init=1*pop)
-					elif i == j and i%2 == 0 and (d == 3 or d == 4 or d == 7):
-						output_layer[tmp_i][tmp_j].add_syn(dneuron,tau=1,w_init=1*pop)
-					else: 
-						output_layer[tmp_i][tmp_j].add_syn(dneuron,tau=1,w_init=-0.1*pop)	
-
-# RL-Diagonal
-if sinusoidchoice["diagonal_rl"]:
-	for i in range(0,neuronrows):
-		row = []
-		for j in range(0,neuroncols):
-			dneuron = line_detectors_drl[i][j]
-			top_i = i - BLOCK_SIZE//2
-			bottom_i = i + BLOCK_SIZE//2
-			left_j = j - BLOCK_SIZE//2
-			right_j = j + BLOCK_SIZE//2
-			for d in range(0,BLOCK_SIZE*BLOCK_SIZE):
-				tmp_i = top_i + (d//BLOCK_SIZE)
-				tmp_j = left_j + (d%BLOCK_SIZE)
-				if (tmp_i >= 0 and tmp_i < nneurons) and (tmp_j >= 0 and tmp_j < nneurons):
-					if j == (nneurons - 1 - i) and i % 2 == 0 and (d == 0 or d == 1 or d == 2 or d == 3 or d == 6):
-						output_layer[tmp_i][tmp_j].add_syn(dneuron,tau=1,w_init=1*pop)
-					elif j == (nneurons - 1 - i) and i % 2 == 0 and (d == 2 or d == 4 or d == 5):
-						output_layer[tmp_i][tmp_j].add_syn(dneuron,tau=1,w_init=1*pop)
-					else: 
-						output_layer[tmp_i][tmp_j].add_syn(dneuron,tau=1,w_init=-0.1*pop)
-
 # Mapping the modified output layer to pixels
 pixelgrid = PixelGrid(output_layer, threshold = 0.75, neuron_to_pixel = True)
 
-def draw_grid_neurons(neurongrid):
-	for nrow in neurongrid:
-		for neuron in nrow:
-			if neuron != None:
-				neuron.draw_neuron(screen)
+# Colours are looked up for the whole grid that is on screen, once a frame
+neuron_layers = {}
 
-def draw_grid_synapses(neurongrid):
-	for nrow in neurongrid:
-		for neuron in nrow:
-			if neuron != None:
-				neuron.draw_synapses(screen)
-
-def update_row_neurons(neuronrow,I_inj = 0):
-	for neuron in neuronrow:
-		if neuron != None:
-			neuron.update(nclock.dt, I_inj = I_inj)
+def draw_grid_neurons(neurongrid):
+	if id(neurongrid) not in neuron_layers:
+		neuron_layers[id(neurongrid)] = NeuronLayer(neurongrid)
+	neuron_layers[id(neurongrid)].draw(screen, snapshot)
 
+# The synapse lines of every grid are rasterized the first time it is drawn
+synapse_layers = {}
 
-def update_grid_neurons(neurongrid, I_inj = 0):
-	executor = ThreadPoolExecutor(max_workers=5)
-	res = [ executor.submit(update_row_neurons, row, I_inj) for row in neurongrid]
-	res = [future.result() for future in res]
+def draw_grid_synapses(neurongrid):
+	if id(neurongrid) not in synapse_layers:
+		synapse_layers[id(neurongrid)] = SynapseLayer(neurongrid)
+	synapse_layers[id(neurongrid)].draw(screen, snapshot)
 
 draw_type = 0
 record = False
-saved_frame = 0
 fc = 0
-framerate = 20
+recorder = Recorder(size, framerate//4, next_recording("recordings"), mode = RECORD_MODE,
+					frame_dir = "frames", queue_size = RECORD_QUEUE)
 
 labeldict = {0:"Pixel Input", 1:"Photoreceptors", 2:"Off-Center-On-Surround", 3:"On-Center-Off-Surround", 4:"Ganglion", 5:"Ganglion Vertical", 6:"Ganglion Horizontal", 7:"Ganglion Diag LR", 8:"Ganglion Diag RL", 9:"Sinusoidal", 10:"Pixel Output"}
 
@@ -419,6 +223,8 @@ mylabel.anim_start(labelanimlen)
 
 num_layers = 11
 
+sim.start()
+
 while not done:
 	pressed = False
 	for event in pygame.event.get():
@@ -441,9 +247,13 @@ while not done:
 				imgindex = (imgindex+1)%len(allimages)
 			if event.key == pygame.K_r:
 				record = not record
+			if event.key == pygame.K_m:
+				sim.set_mode(sim_modes[(sim_modes.index(sim.mode)+1)%len(sim_modes)])
 	
 	currimg = allimages[imgindex]
-				
+	sim.set_input(currimg)
+	# Everything this frame is drawn from the same published state
+	snapshot = sim.latest()
 	
 	screen.fill(BLACK)
 	
@@ -489,46 +299,23 @@ while not done:
 			draw_grid_neurons(output_layer)
 		
 		if draw_type == 10:
-			pixelgrid.update()
+			pixelgrid.update(snapshot = snapshot)
 			pixelgrid.draw(screen)
 	
 	if DRAW_LABELS:
 		mylabel.draw(screen, mylabelpos)
 		
-	this_time = 0
-	while this_time < newtimestep:
-		this_time += dt
-		
-		currtime = nclock.get_time()
-		
-		for i in range(0, neuronrows):
-			for j in range(0, neuroncols):
-				neurongrid[i][j].update(nclock.dt, I_inj = 10*currimg[i][j])
-		update_grid_neurons(oncoffs, I_inj = 0.5)
-		update_grid_neurons(offcons, I_inj = 0.5)
-		update_grid_neurons(line_detectors)
-		update_grid_neurons(output_layer)
-		nclock.tick()
-		
 	fc += 1
 	
 	mylabel.anim_update()
 	
 	if record:
-		pygame.image.save(screen, 
-			os.path.join(frame_dir,('img%d' % saved_frame)+".png"))
-		saved_frame += 1
+		recorder.add_frame(screen)
 	pygame.display.flip()
 	gclock.tick(framerate)
 
+sim.stop()
+recorder.close()
+if pool is not None:
+	pool.shutdown()
 pygame.quit()
-
-frames_exist = not not [f for f in os.listdir(frame_dir) 
-			if os.path.isfile(os.path.join(frame_dir, f))]
-if frames_exist:
-	inputfilestring = frame_dir + '/' + 'img%d.png'
-	outputfilestring = record_dir + '/' + str(curr_recording_idx)+'.mp4'
-	ffmpegpath = "ffmpeg"
-	subprocess.call([ffmpegpath, '-framerate', str(framerate//4), 
-	'-i', inputfilestring, '-crf', str(framerate//4), '-pix_fmt', 'yuv420p', 
-	outputfilestring])
@@ -0,0 +1,114 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from neuron import Projection
+
+# On-disk cache of compiled networks. Every network is a directory of plain
+# .npy files, one per population parameter and one per projection field,
+# plus a meta.json describing how they fit together. Loading memory maps the
+# arrays (copy on write, so the network can still be changed afterwards) and
+# skips the wiring. Each projection keeps its synapse arrays, already sorted
+# by postsynaptic neuron, and derives the rest from them the same way
+# compile() does: the CSR row pointers, the shared traces and the event
+# fan-out lists. The population parameters are copied into the populations.
+# Those are a few NumPy passes per projection. Storing their results too
+# would mean more files to open, which costs about as much as it saves.
+#
+# Caches are keyed by a hash of everything that goes into building the
+# network, so a change to any of it simply misses the cache. A fresh one is
+# then built and the caches of every other key are removed.
+
+FORMAT = 1
+population_fields = ['v_r', 'R_m', 'tau', 'threshold', 'isinput', 'compute_firing_rate']
+
+# Hash of the parameters and of the source files that do the wiring
+def cache_key(params, sources = ()):
+	h = hashlib.sha1()
+	h.update(json.dumps([FORMAT, params], sort_keys = True).encode())
+	for source in sources:
+		try:
+			with open(source, 'rb') as f:
+				h.update(f.read())
+		except (IOError, OSError, TypeError):
+			h.update(str(source).encode())
+	return h.hexdigest()[:16]
+
+# Writes the populations in layers and every projection between them
+def save_network(path, layers):
+	tmp = path + '.tmp%d' % os.getpid()
+	os.makedirs(tmp)
+	meta = {'format': FORMAT, 'layers': [], 'projections': []}
+	for i, layer in enumerate(layers):
+		meta['layers'].append(layer.size)
+		for name in population_fields:
+			np.save(os.path.join(tmp, 'layer%d_%s.npy' % (i, name)), getattr(layer, name)[:layer.size])
+		# Projections are stored in the order their currents are summed
+		for pre, proj in layer.projections.items():
+			proj.compile()
+			n = len(meta['projections'])
+			meta['projections'].append([layers.index(pre), i])
+			for name in proj.fields + ['posts']:
+				np.save(os.path.join(tmp, 'proj%d_%s.npy' % (n, name)), getattr(proj, name))
+	# meta.json is written last, so a directory without it is an interrupted save
+	with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+		json.dump(meta, f)
+	try:
+		os.rename(tmp, path)
+	except OSError:
+		# Someone else saved the same network first
+		shutil.rmtree(tmp, ignore_errors = True)
+
+# Fills the empty populations in layers from the cache at path. Returns False
+# if there is no complete cache there. Every array is opened before any layer
+# is touched, so a missing or broken file leaves the layers empty for build().
+def load_network(path, layers):
+	load = lambda name: np.load(os.path.join(path, name + '.npy'), mmap_mode = 'c')
+	try:
+		with open(os.path.join(path, 'meta.json')) as f:
+			meta = json.load(f)
+		if meta.get('format') != FORMAT or len(meta['layers']) != len(layers):
+			return False
+		populations = []
+		for i, size in enumerate(meta['layers']):
+			fields = dict((name, load('layer%d_%s' % (i, name))) for name in population_fields)
+			if any(len(field) != size for field in fields.values()):
+				return False
+			populations.append(fields)
+		projections = []
+		for n in range(len(meta['projections'])):
+			projections.append(dict((name, load('proj%d_%s' % (n, name)))
+									for name in Projection.fields + ['posts']))
+	except (IOError, OSError, ValueError, KeyError, TypeError):
+		return False
+	for layer, size, fields in zip(layers, meta['layers'], populations):
+		layer.add_neurons(size, fields['v_r'], fields['R_m'], fields['tau'], fields['threshold'],
+							is_input = fields['isinput'], compute_firing_rate = fields['compute_firing_rate'])
+	for (pre, post), arrays in zip(meta['projections'], projections):
+		layers[post].connect(layers[pre]).load(arrays)
+	return True
+
+# Removes the caches in directory of every key but key
+def prune(directory, key):
+	for name in os.listdir(directory):
+		path = os.path.join(directory, name)
+		cache = len(name) == 16 or os.path.exists(os.path.join(path, 'meta.json'))
+		if name != key and os.path.isdir(path) and cache:
+			shutil.rmtree(path, ignore_errors = True)
+
+# Loads the network from the cache under directory, or builds it with build()
+# and saves it there if it isn't cached yet
+def cached_build(directory, key, layers, build):
+	path = os.path.join(directory, key)
+	if load_network(path, layers):
+		return True
+	build()
+	try:
+		if os.path.isdir(path):
+			shutil.rmtree(path)
+		save_network(path, layers)
+		prune(directory, key)
+	except (IOError, OSError):
+		pass
+	return False
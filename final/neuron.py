@@ -1,49 +1,849 @@
 import numpy as np
 from collections import deque as Queue
 import math
+from workerpool import run_chunks
+import kernels
+from tracebuffer import TraceBuffer
 from cython.parallel import *
 t_window = 2
 t_step = 5
 
+# A synapse is a view onto one entry of a Projection. Creating one the old way,
+# Synapse(n_pre, n_post, ...), adds a new entry to the projection between the
+# two neurons' populations.
 class Synapse:
 	def __init__(self, n_pre, n_post, tau = 1, w_init = 0.5, **kwargs):
 		self.n_pre = n_pre
 		self.n_post = n_post
-		self.w = w_init
-		self.I = 0
-		self.tau = tau
-		self.sign = kwargs.get('sign', 1)
-			
-	def update(self, dt):
-		dIdt = (-self.I/self.tau) + self.n_pre.currspike
-		self.I = self.I + dt*dIdt
-			
+		self.projection = n_post.population.connect(n_pre.population)
+		self.id = kwargs.get('id', None)
+		if self.id is None:
+			self.id = self.projection.add_syn(n_pre.index, n_post.index, tau = tau,
+												w_init = w_init, sign = kwargs.get('sign', 1))
+	
+	def __eq__(self, other):
+		return (isinstance(other, Synapse) and self.projection is other.projection
+				and self.id == other.id)
+	
+	def __hash__(self):
+		return hash((id(self.projection), self.id))
+	
+	def _get(self, name):
+		return float(getattr(self.projection, name)[self.projection.get_slot(self.id)])
+	
+	@property
+	def w(self):
+		return self._get('w')
+	
+	@w.setter
+	def w(self, value):
+		self.projection.set_weight(self.id, w = value)
+	
+	@property
+	def sign(self):
+		return self._get('sign')
+	
+	@sign.setter
+	def sign(self, value):
+		self.projection.set_weight(self.id, sign = value)
+	
+	@property
+	def tau(self):
+		return self._get('tau')
+	
+	@property
+	def I(self):
+		proj = self.projection
+		return proj.trace_value(proj.post.view_batch, proj.trace[proj.get_slot(self.id)])
+	
 	def sout(self):
 		return self.sign * self.w * self.I
 
+# Sums the entries of every row of a CSR matrix, i.e. the matrix-vector
+# product once the values have been multiplied by the vector. values can have
+# a leading batch axis.
+def csr_rowsum(indptr, values):
+	out = np.zeros(values.shape[:-1] + (len(indptr) - 1,))
+	nonempty = indptr[:-1] < indptr[1:]
+	if values.shape[-1] > 0:
+		out[..., nonempty] = np.add.reduceat(values, indptr[:-1][nonempty], axis = -1)
+	return out
+
+# Concatenates the index ranges [starts[i], ends[i]) and returns them along
+# with which range each index came from
+def expand_ranges(starts, ends):
+	counts = ends - starts
+	owner = np.repeat(np.arange(len(starts)), counts)
+	pos = np.arange(counts.sum()) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+	return pos, owner
+
+# All the synapses from one population onto another, stored as CSR arrays
+# ordered by postsynaptic neuron. New synapses are queued up and only merged
+# into the arrays when the projection is next used.
+#
+# The current trace dI/dt = -I/tau + currspike only depends on the presynaptic
+# neuron and tau, so synapses sharing both read from one shared trace and the
+# CSR matrix maps traces onto postsynaptic neurons.
+#
+# In event driven mode nothing is done per synapse unless a presynaptic neuron
+# spiked. The postsynaptic currents are kept split by tau, since all the traces
+# with the same tau decay by the same factor every step, and spikes are pushed
+# along the presynaptic neuron's outgoing synapses. The traces themselves are
+# only brought up to date when a spike arrives or when someone reads them.
+class Projection:
+	fields = ['indices', 'w', 'sign', 'tau', 'ids']
+	# Projections with at most this many synapses, like the ones between
+	# single Neurons, are sorted and have their traces found in plain Python,
+	# which for a few synapses is much quicker than the NumPy passes
+	small = 64
+	
+	def __init__(self, pre, post, event_driven = False):
+		self.pre = pre
+		self.post = post
+		self.indices = np.zeros(0, dtype = np.int64)
+		self.w = np.zeros(0)
+		self.sign = np.zeros(0)
+		self.tau = np.zeros(0)
+		self.ids = np.zeros(0, dtype = np.int64)
+		self.posts = np.zeros(0, dtype = np.int64)
+		self.data = np.zeros(0)
+		self.indptr = np.zeros(1, dtype = np.int64)
+		self.slots = np.zeros(0, dtype = np.int64)
+		# Shared traces, one per (presynaptic neuron, tau)
+		self.trace = np.zeros(0, dtype = np.int64)
+		self.trace_pre = np.zeros(0, dtype = np.int64)
+		self.trace_tau = np.zeros(0)
+		self.trace_I = np.zeros((post.batch, 0))
+		self.trace_steps = np.zeros(0, dtype = np.int64)
+		# Event driven state, trace_I holds each trace's value as of trace_last
+		self.event_driven = event_driven
+		self.event_dt = None
+		self.event_step = 0
+		self.trace_last = np.zeros((post.batch, 0), dtype = np.int64)
+		self.post_I = None
+		# Python lists of the arrays update_single reads, made when first needed
+		self.single = None
+		self.next_id = 0
+		self.pending = []
+		self.pending_blocks = []
+		self.removed = set()
+	
+	def __len__(self):
+		self.compile()
+		return len(self.ids)
+	
+	@property
+	def I(self):
+		return self.traces()[:, self.trace]
+	
+	# Returns the current value of every shared trace
+	def traces(self):
+		if not self.event_driven or self.event_dt is None:
+			return self.trace_I
+		decay = 1 - self.event_dt/self.trace_tau
+		return self.trace_I * decay ** (self.event_step - self.trace_last)
+	
+	def trace_value(self, b, tr):
+		if not self.event_driven or self.event_dt is None:
+			return float(self.trace_I[b, tr])
+		decay = 1 - self.event_dt/self.trace_tau[tr]
+		return float(self.trace_I[b, tr] * decay ** (self.event_step - self.trace_last[b, tr]))
+	
+	def trace_values(self, b, tr):
+		if not self.event_driven or self.event_dt is None:
+			return self.trace_I[b, tr]
+		decay = 1 - self.event_dt/self.trace_tau[tr]
+		return self.trace_I[b, tr] * decay ** (self.event_step - self.trace_last[b, tr])
+	
+	# Brings every trace up to date
+	def _materialize(self):
+		if self.event_driven and self.event_dt is not None:
+			self.trace_I = self.traces()
+			self.trace_last[:] = self.event_step
+	
+	def set_event_driven(self, event_driven):
+		self.compile()
+		self._materialize()
+		self.event_driven = event_driven
+		self.event_dt = None
+		if event_driven:
+			self._build_events()
+	
+	def add_syn(self, pre_idx, post_idx, tau = 1, w_init = 0.5, sign = 1):
+		syn_id = self.next_id
+		self.next_id += 1
+		self.pending.append((pre_idx, post_idx, w_init, sign, tau, syn_id))
+		self.single = None
+		return syn_id
+	
+	# Adds a whole block of synapses at once, every argument can be an array
+	# with one entry per synapse. Returns their ids.
+	def add_syns(self, pre_idx, post_idx, tau = 1, w_init = 0.5, sign = 1):
+		pre_idx = np.asarray(pre_idx, dtype = np.int64).ravel()
+		n = len(pre_idx)
+		ids = self.next_id + np.arange(n, dtype = np.int64)
+		self.next_id += n
+		self.pending_blocks.append(tuple(np.broadcast_to(col, n) for col in
+									(pre_idx, post_idx, w_init, sign, tau, ids)))
+		self.single = None
+		return ids
+	
+	def remove_syn(self, syn_id):
+		self.removed.add(syn_id)
+		self.single = None
+	
+	def compile(self):
+		if not self.pending and not self.pending_blocks and not self.removed:
+			# Neurons added to either population need rows too
+			if len(self.indptr) != self.post.size + 1:
+				self._build_indptr()
+				if self.event_driven:
+					self._build_events()
+			return
+		self._materialize()
+		if not self.pending_blocks and len(self.ids) + len(self.pending) <= self.small:
+			self._compile_small()
+			return
+		if self.pending:
+			self.pending_blocks.append(tuple(np.array(col) for col in zip(*self.pending)))
+			self.pending = []
+		if self.pending_blocks:
+			# The order blocks are joined in doesn't matter, the ids sort them below
+			pre, posts, w, sign, tau, ids = (np.concatenate(col) for col in zip(*self.pending_blocks))
+			self.indices = np.concatenate([self.indices, pre.astype(np.int64)])
+			self.posts = np.concatenate([self.posts, posts.astype(np.int64)])
+			self.w = np.concatenate([self.w, w.astype(float)])
+			self.sign = np.concatenate([self.sign, sign.astype(float)])
+			self.tau = np.concatenate([self.tau, tau.astype(float)])
+			self.ids = np.concatenate([self.ids, ids.astype(np.int64)])
+			self.pending_blocks = []
+		keep = np.ones(len(self.ids), dtype = bool)
+		if self.removed:
+			keep = ~np.isin(self.ids, list(self.removed))
+			self.removed = set()
+		# Sort by postsynaptic neuron, keeping the order the synapses were added in
+		order = np.lexsort((self.ids[keep], self.posts[keep]))
+		for name in self.fields + ['posts']:
+			setattr(self, name, getattr(self, name)[keep][order])
+		self._install()
+	
+	# compile() for a few synapses added one at a time, giving the same arrays
+	def _compile_small(self):
+		names = ['indices', 'posts', 'w', 'sign', 'tau', 'ids']
+		rows = list(zip(*(getattr(self, name).tolist() for name in names))) + self.pending
+		if self.removed:
+			rows = [row for row in rows if row[5] not in self.removed]
+		rows.sort(key = lambda row: (row[1], row[5]))
+		columns = list(zip(*rows)) if rows else [()]*len(names)
+		for name, column in zip(names, columns):
+			setattr(self, name, np.array(column, dtype = self.w.dtype if name in ('w', 'sign', 'tau') else np.int64))
+		self.pending = []
+		self.removed = set()
+		self._install()
+	
+	# Replaces every synapse with arrays that are already compiled, i.e.
+	# sorted by postsynaptic neuron, e.g. ones loaded from a cache
+	def load(self, arrays):
+		for name in self.fields + ['posts']:
+			setattr(self, name, arrays[name])
+		self.next_id = int(self.ids.max()) + 1 if len(self.ids) > 0 else 0
+		self.pending = []
+		self.pending_blocks = []
+		self.removed = set()
+		self._install()
+	
+	def _install(self):
+		self.single = None
+		self.data = self.sign * self.w
+		self._build_indptr()
+		self.slots = np.full(self.next_id, -1, dtype = np.int64)
+		self.slots[self.ids] = np.arange(len(self.ids))
+		self._build_traces()
+		if self.event_driven:
+			self._build_events()
+	
+	def _build_indptr(self):
+		self.indptr = np.zeros(self.post.size + 1, dtype = np.int64)
+		np.cumsum(np.bincount(self.posts, minlength = self.post.size), out = self.indptr[1:])
+	
+	def _build_traces(self):
+		old = dict(zip(zip(self.trace_pre.tolist(), self.trace_tau.tolist()),
+						range(len(self.trace_pre))))
+		# Unique (presynaptic neuron, tau) pairs, sorted by neuron and then tau.
+		# There are only ever a few taus, so the pair is packed into one integer.
+		if len(self.tau) <= self.small:
+			pairs = list(zip(self.indices.tolist(), self.tau.tolist()))
+			unique = sorted(set(pairs))
+			position = dict(zip(unique, range(len(unique))))
+			self.trace = np.array([position[pair] for pair in pairs], dtype = np.int64)
+			self.trace_pre = np.array([pre for pre, _ in unique], dtype = np.int64)
+			self.trace_tau = np.array([tau for _, tau in unique], dtype = float)
+		else:
+			taus, tau_class = np.unique(self.tau, return_inverse = True)
+			keys = self.indices*len(taus) + tau_class.reshape(-1)
+			unique, self.trace = np.unique(keys, return_inverse = True)
+			self.trace = self.trace.reshape(-1)
+			self.trace_pre = unique // max(len(taus), 1)
+			self.trace_tau = taus[unique % max(len(taus), 1)]
+		# Traces that already existed keep their current
+		trace_I = np.zeros((self.post.batch, len(unique)))
+		trace_steps = np.zeros(len(unique), dtype = np.int64)
+		if old and self.trace_I.shape[0] == self.post.batch:
+			kept = [(i, old[key]) for i, key in enumerate(zip(self.trace_pre.tolist(), self.trace_tau.tolist()))
+					if key in old]
+			if kept:
+				new, previous = np.array(kept).T
+				trace_I[:, new] = self.trace_I[:, previous]
+				trace_steps[new] = self.trace_steps[previous]
+		self.trace_I = trace_I
+		self.trace_steps = trace_steps
+		self.trace_last = np.full(trace_I.shape, self.event_step, dtype = np.int64)
+	
+	# Fan-out lists used to push spikes in event driven mode
+	def _build_events(self):
+		self.taus, self.trace_class = np.unique(self.trace_tau, return_inverse = True)
+		self.trace_class = self.trace_class.reshape(-1)
+		order = np.argsort(self.indices, kind = 'stable')
+		self.fan_indptr = np.zeros(self.pre.size + 1, dtype = np.int64)
+		np.cumsum(np.bincount(self.indices, minlength = self.pre.size), out = self.fan_indptr[1:])
+		self.fan_post = self.posts[order]
+		self.fan_class = self.trace_class[self.trace[order]]
+		self.fan_data = self.data[order]
+		# np.unique leaves the traces sorted by presynaptic neuron
+		self.trace_indptr = np.zeros(self.pre.size + 1, dtype = np.int64)
+		np.cumsum(np.bincount(self.trace_pre, minlength = self.pre.size), out = self.trace_indptr[1:])
+		# Postsynaptic currents for each tau, rebuilt from the traces
+		values = self.traces()[:, self.trace] * self.data
+		self.post_I = np.zeros((len(self.taus), self.post.batch, self.post.size))
+		for k in range(len(self.taus)):
+			self.post_I[k] = csr_rowsum(self.indptr, values * (self.trace_class[self.trace] == k))
+	
+	# Clears the synaptic currents, e.g. before presenting a new image
+	def reset(self):
+		self.compile()
+		self.trace_I = np.zeros((self.post.batch, len(self.trace_pre)))
+		self.trace_last = np.full(self.trace_I.shape, self.event_step, dtype = np.int64)
+		if self.event_driven:
+			self._build_events()
+	
+	def get_slot(self, syn_id):
+		self.compile()
+		return self.slots[syn_id]
+	
+	def set_weight(self, syn_id, w = None, sign = None):
+		slot = self.get_slot(syn_id)
+		if w is not None:
+			self.w[slot] = w
+		if sign is not None:
+			self.sign[slot] = sign
+		self.data[slot] = self.sign[slot] * self.w[slot]
+		self.single = None
+		if self.event_driven:
+			self._build_events()
+	
+	# Returns the ids of the synapses onto one postsynaptic neuron
+	def post_syns(self, post_idx):
+		self.compile()
+		if post_idx + 1 >= len(self.indptr):
+			return []
+		return list(self.ids[self.indptr[post_idx]:self.indptr[post_idx + 1]])
+	
+	def step_traces(self, dt, traces = slice(None)):
+		if isinstance(traces, slice):
+			start, stop, _ = traces.indices(len(self.trace_pre))
+			kernels.trace_step(self.trace_I, self.trace_tau, self.trace_pre, self.pre.currspike,
+								self.trace_steps, dt, start, stop)
+			return
+		I = self.trace_I[:, traces]
+		dIdt = (-I/self.trace_tau[traces]) + self.pre.currspike[:, self.trace_pre[traces]]
+		self.trace_I[:, traces] = I + dt*dIdt
+		self.trace_steps[traces] += 1
+	
+	def update_events(self, dt):
+		if self.event_dt != dt:
+			self._materialize()
+			self.event_dt = dt
+		self.event_step += 1
+		self.post_I *= (1 - dt/self.taus)[:, None, None]
+		b, p = np.nonzero(self.pre.currspike[:, :len(self.fan_indptr) - 1])
+		if len(p) > 0:
+			# Push the spikes onto the postsynaptic currents
+			pos, owner = expand_ranges(self.fan_indptr[p], self.fan_indptr[p + 1])
+			np.add.at(self.post_I, (self.fan_class[pos], b[owner], self.fan_post[pos]),
+						dt*self.fan_data[pos])
+			# and bring the traces that received them up to date
+			tr, owner = expand_ranges(self.trace_indptr[p], self.trace_indptr[p + 1])
+			tb = b[owner]
+			decay = 1 - dt/self.trace_tau[tr]
+			self.trace_I[tb, tr] = (self.trace_I[tb, tr] * decay ** (self.event_step - self.trace_last[tb, tr])
+									+ dt)
+			self.trace_last[tb, tr] = self.event_step
+		return self.post_I.sum(axis = 0)
+	
+	# Steps every trace and sums the synapses onto every postsynaptic neuron.
+	# Both passes are split into contiguous chunks for the worker pool, traces
+	# for the first and postsynaptic rows for the second.
+	def update_dense(self, dt):
+		pool = self.post.pool
+		run_chunks(pool, lambda start, stop: self.step_traces(dt, slice(start, stop)),
+					len(self.trace_pre), self.post.batch)
+		out = np.zeros((self.post.batch, self.post.size))
+		rowsum = lambda start, stop: kernels.trace_rowsum(self.indptr, self.data, self.trace, self.trace_I,
+															out, start, stop)
+		fan_in = max(1, len(self.trace) // max(self.post.size, 1))
+		run_chunks(pool, rowsum, self.post.size, self.post.batch*fan_in)
+		return out
+	
+	# Integrates the synaptic currents and returns the total current onto
+	# every postsynaptic neuron, or only onto rows if it is given
+	def update(self, dt, rows = None):
+		self.compile()
+		if self.event_driven:
+			if rows is not None:
+				raise Exception("Event driven projections can only be stepped as a whole")
+			return self.update_events(dt)
+		if rows is None:
+			return self.update_dense(dt)
+		starts = self.indptr[rows]
+		ends = self.indptr[rows + 1]
+		sel, _ = expand_ranges(starts, ends)
+		indptr = np.concatenate([[0], np.cumsum(ends - starts)])
+		# A trace shared with neurons outside rows may already have been
+		# stepped for this tick, so only step the ones that are behind
+		traces = np.unique(self.trace[sel])
+		target = np.zeros(len(self.trace_pre), dtype = np.int64)
+		np.maximum.at(target, self.trace[sel], self.post.steps[self.posts[sel]] + 1)
+		self.step_traces(dt, traces[self.trace_steps[traces] < target[traces]])
+		return csr_rowsum(indptr, self.data[sel]*self.trace_I[:, self.trace[sel]])
+	
+	# update() for a projection onto a population of one neuron and one batch
+	# entry, e.g. a Neuron on its own. Such a projection usually has only a
+	# synapse or two, so it is stepped with plain Python numbers rather than
+	# NumPy calls, in the same order as the kernels. step is the postsynaptic
+	# neuron's next tick, which every trace is stepped to. Returns the current.
+	def update_single(self, dt, step):
+		if self.single is None:
+			self.compile()
+			self.single = (list(zip(self.trace_pre.tolist(), self.trace_tau.tolist())),
+							list(zip(self.trace.tolist(), self.data.tolist())))
+		traces, synapses = self.single
+		trace_I = self.trace_I
+		trace_steps = self.trace_steps
+		currspike = self.pre.currspike
+		for t, (pre, tau) in enumerate(traces):
+			I = trace_I.item(0, t)
+			dIdt = (-I/tau) + currspike.item(0, pre)
+			trace_I[0, t] = I + dt*dIdt
+			trace_steps[t] = step
+		total = 0.0
+		for t, data in synapses:
+			total = total + data*trace_I.item(0, t)
+		return total
+
+# Sliding window over the last t_window/dt spikes of every neuron in a
+# population. The spike count is kept up to date as spikes enter and leave the
+# ring buffer, so reading the rate never needs a pass over the window.
+class SpikeWindow:
+	def __init__(self, capacity, batch = 1):
+		self.capacity = capacity
+		self.batch = batch
+		self.window = 0
+		self.spikes = None
+		self.pos = None
+		self.length = None
+		self.count = None
+	
+	def grow(self, capacity):
+		if self.spikes is not None:
+			extra = capacity - self.capacity
+			self.spikes = np.concatenate([self.spikes,
+				np.zeros((self.batch, extra, self.window), dtype = np.uint8)], axis = 1)
+			self.pos = np.concatenate([self.pos, np.zeros(extra, dtype = np.int64)])
+			self.length = np.concatenate([self.length, np.zeros(extra, dtype = np.int64)])
+			self.count = np.concatenate([self.count,
+				np.zeros((self.batch, extra), dtype = np.int64)], axis = 1)
+		self.capacity = capacity
+	
+	def reset(self):
+		self.window = 0
+		self.spikes = None
+	
+	# The window length depends on dt, so the buffer is only allocated once
+	# the first step tells us what dt is
+	def set_dt(self, dt):
+		global t_window
+		window = int(math.floor(t_window/dt))
+		if window == self.window:
+			return
+		spikes = np.zeros((self.batch, self.capacity, window), dtype = np.uint8)
+		length = np.zeros(self.capacity, dtype = np.int64)
+		# Keep whatever history fits when the window changes size
+		if self.spikes is not None:
+			for i in range(self.capacity):
+				for b in range(self.batch):
+					old = self.history(i, b)[-window:]
+					spikes[b, i, :len(old)] = old
+					length[i] = len(old)
+		self.window = window
+		self.spikes = spikes
+		self.length = length
+		self.pos = length % window
+		self.count = spikes.sum(axis = 2, dtype = np.int64)
+	
+	def push(self, rows, spiked):
+		kernels.window_push(self.spikes, self.pos, self.length, self.count, spiked, rows.start, rows.stop)
+	
+	def rate(self, rows):
+		return self.count[:, rows]/np.maximum(self.length[rows], 1)
+	
+	# push and rate for neuron i of a population with one batch entry
+	def push_single(self, i, spiked):
+		p = self.pos.item(i)
+		n = self.length.item(i)
+		if n == self.window:
+			self.count[0, i] = self.count.item(0, i) + spiked - self.spikes.item(0, i, p)
+		else:
+			self.count[0, i] = self.count.item(0, i) + spiked
+			self.length[i] = n + 1
+		self.spikes[0, i, p] = spiked
+		self.pos[i] = (p + 1) % self.window
+	
+	def rate_single(self, i):
+		return self.count.item(0, i)/max(self.length.item(i), 1)
+	
+	# Returns the spike history of one neuron, oldest first
+	def history(self, idx, b = 0):
+		if self.spikes is None or idx >= self.capacity:
+			return []
+		n = self.length[idx]
+		start = (self.pos[idx] - n) % self.window
+		order = (start + np.arange(n)) % self.window
+		return list(self.spikes[b, idx, order])
+
+# Exponential moving average of the spike train with the same time constant
+# as the sliding window. Cheaper still and needs no history, but the rate
+# responds smoothly instead of dropping spikes after exactly t_window.
+class SpikeEMA:
+	def __init__(self, capacity, batch = 1):
+		self.capacity = capacity
+		self.batch = batch
+		self.alpha = 0
+		self.ema = np.zeros((batch, capacity))
+	
+	def grow(self, capacity):
+		self.ema = np.concatenate([self.ema,
+			np.zeros((self.batch, capacity - self.capacity))], axis = 1)
+		self.capacity = capacity
+	
+	def reset(self):
+		self.ema = np.zeros((self.batch, self.capacity))
+	
+	def set_dt(self, dt):
+		global t_window
+		self.alpha = min(dt/t_window, 1)
+	
+	def push(self, rows, spiked):
+		ema = self.ema[:, rows]
+		self.ema[:, rows] = ema + self.alpha*(spiked - ema)
+	
+	def rate(self, rows):
+		return self.ema[:, rows]
+	
+	def push_single(self, i, spiked):
+		ema = self.ema.item(0, i)
+		self.ema[0, i] = ema + self.alpha*(spiked - ema)
+	
+	def rate_single(self, i):
+		return self.ema.item(0, i)
+	
+	def history(self, idx, b = 0):
+		return []
+
+# Struct-of-arrays storage for a whole layer of LIF neurons. Every neuron in
+# the layer lives at an index into these arrays and a single call to update
+# advances all of them at once.
+#
+# The state arrays have a leading batch axis so that the same network can be
+# run on several inputs at once, e.g. a batch of MNIST images. Neuron views
+# read from batch entry view_batch.
+class Population:
+	params = ['v_r', 'R_m', 'tau', 'threshold']
+	state = ['v', 'currspike', 'firing_rate', 'vout']
+	flags = ['isinput', 'compute_firing_rate']
+	counters = ['steps']
+	
+	def __init__(self, capacity = 16, batch = 1, **kwargs):
+		self.size = 0
+		self.capacity = capacity
+		self.batch = batch
+		self.view_batch = 0
+		for name in self.params:
+			setattr(self, name, np.zeros(capacity))
+		for name in self.state:
+			setattr(self, name, np.zeros((batch, capacity)))
+		for name in self.flags:
+			setattr(self, name, np.zeros(capacity, dtype = bool))
+		for name in self.counters:
+			setattr(self, name, np.zeros(capacity, dtype = np.int64))
+		self.neurons = []
+		self.projections = {}
+		self.event_driven = kwargs.get('event_driven', False)
+		# Optional WorkerPool shared between layers for stepping the
+		# population in chunks
+		self.pool = kwargs.get('pool', None)
+		self.pending = None
+		# Estimator for the firing rate, either a sliding window or an
+		# exponential moving average
+		if kwargs.get('rate_estimator', 'window') == 'ema':
+			self.rates = SpikeEMA(capacity, batch)
+		else:
+			self.rates = SpikeWindow(capacity, batch)
+	
+	def _grow(self):
+		self.capacity *= 2
+		for name in self.params + self.flags + self.counters:
+			arr = getattr(self, name)
+			newarr = np.zeros(self.capacity, dtype = arr.dtype)
+			newarr[:self.size] = arr[:self.size]
+			setattr(self, name, newarr)
+		for name in self.state:
+			arr = getattr(self, name)
+			newarr = np.zeros((self.batch, self.capacity))
+			newarr[:, :self.size] = arr[:, :self.size]
+			setattr(self, name, newarr)
+		self.rates.grow(self.capacity)
+	
+	def add_neuron(self, v_r = 0, R_m = 1, tau = 1, threshold = 0.2, **kwargs):
+		if self.size == self.capacity:
+			self._grow()
+		idx = self.size
+		self.size += 1
+		self.v[:, idx] = v_r
+		self.v_r[idx] = v_r
+		self.R_m[idx] = R_m
+		self.tau[idx] = tau
+		self.threshold[idx] = threshold
+		self.vout[:, idx] = v_r
+		self.isinput[idx] = kwargs.get('is_input', False)
+		self.compute_firing_rate[idx] = kwargs.get('compute_firing_rate', True)
+		self.neurons.append(kwargs.get('neuron', None))
+		return idx
+	
+	# Adds n neurons at once without creating Neuron objects for them and
+	# returns their indices. The parameters can be arrays with one entry each.
+	def add_neurons(self, n, v_r = 0, R_m = 1, tau = 1, threshold = 0.2, **kwargs):
+		while self.size + n > self.capacity:
+			self._grow()
+		idx = np.arange(self.size, self.size + n)
+		self.size += n
+		self.v[:, idx] = v_r
+		self.v_r[idx] = v_r
+		self.R_m[idx] = R_m
+		self.tau[idx] = tau
+		self.threshold[idx] = threshold
+		self.vout[:, idx] = v_r
+		self.isinput[idx] = kwargs.get('is_input', False)
+		self.compute_firing_rate[idx] = kwargs.get('compute_firing_rate', True)
+		self.neurons.extend([None]*n)
+		return idx
+	
+	# Puts every neuron back at rest and clears the spike history and synaptic
+	# currents, optionally changing the batch size at the same time
+	def reset(self, batch = None):
+		if batch is not None:
+			self.batch = batch
+			self.view_batch = 0
+			self.rates.batch = batch
+		for name in self.state:
+			setattr(self, name, np.zeros((self.batch, self.capacity)))
+		self.v[:] = self.v_r
+		self.vout[:] = self.v_r
+		self.steps[:] = 0
+		self.rates.reset()
+		for proj in self.projections.values():
+			proj.reset()
+	
+	# Returns the spike history of one neuron, oldest first
+	def get_spikes(self, idx):
+		return self.rates.history(idx, self.view_batch)
+	
+	# Returns the projection carrying synapses from pre onto this population
+	def connect(self, pre):
+		if pre not in self.projections:
+			self.projections[pre] = Projection(pre, self, event_driven = self.event_driven)
+		return self.projections[pre]
+	
+	def I_syn(self, dt, rows = None):
+		I = 0
+		for proj in self.projections.values():
+			I = I + proj.update(dt, rows)
+		return I
+	
+	# Total input current onto rows. I_inj is either a scalar, an array with
+	# one entry per neuron, or one such array per batch entry.
+	def input_current(self, dt, I_inj, rows, index = None):
+		I_inj = np.asarray(I_inj, dtype = float)
+		if I_inj.ndim > 0:
+			I_inj = I_inj.reshape(-1, self.size)[:, rows]
+		I_syn = self.I_syn(dt, None if index is None else rows)
+		# Input neurons just take in the injected current i.e. no synaptic
+		# connections, everything else aggregates the weighted synaptic inputs
+		I_total = np.where(self.isinput[rows], 0, I_syn) + I_inj
+		if I_total.ndim < 2:
+			# Nothing but scalars went in, e.g. a neuron without synapses
+			I_total = np.tile(I_total, (self.batch, 1))
+		# Catching when current input is unreasonably high
+		if np.isnan(I_total).any():
+			raise Exception("Current is NaN")
+		return I_total
+	
+	# Advances every neuron in the population by dt. Passing index only steps
+	# that neuron.
+	def update(self, dt, I_inj = 0, learn = False, index = None):
+		if index is None:
+			self.compute(dt, I_inj)
+			return self.commit()
+		if self.size == 1 and self.batch == 1 and not self.event_driven:
+			return self.update_single(dt, I_inj)
+		self.rates.set_dt(dt)
+		I_total = self.input_current(dt, I_inj, np.atleast_1d(index), index)
+		v, spiked = self.next_state(dt, index, index + 1, I_total)
+		self.write_state(index, index + 1, v, spiked)
+		return self.vout[:, index:index + 1]
+	
+	# update() for a population of one neuron and one batch entry, like the
+	# one a Neuron gets when it isn't given a population. Plain Python numbers
+	# are much quicker than NumPy calls for a single value, the arithmetic is
+	# the same as in the kernels.
+	def update_single(self, dt, I_inj):
+		self.rates.set_dt(dt)
+		if isinstance(I_inj, (int, float)):
+			I_inj = float(I_inj)
+		else:
+			I_inj = np.asarray(I_inj, dtype = float).item(0)
+		step = self.steps.item(0) + 1
+		I_syn = 0.0
+		for proj in self.projections.values():
+			I_syn = I_syn + proj.update_single(dt, step)
+		I_total = I_inj if self.isinput.item(0) else I_syn + I_inj
+		if math.isnan(I_total):
+			raise Exception("Current is NaN")
+		v = self.v.item(0, 0)
+		dvdt = (-v + self.R_m.item(0) * I_total)/self.tau.item(0)
+		v = v + dt*dvdt
+		spiked = v >= self.threshold.item(0)
+		if spiked:
+			self.v[0, 0] = self.v_r.item(0)
+			self.vout[0, 0] = self.threshold.item(0)
+		else:
+			self.v[0, 0] = v
+			self.vout[0, 0] = v
+		self.currspike[0, 0] = spiked
+		self.rates.push_single(0, int(spiked))
+		self.steps[0] = step
+		if self.compute_firing_rate.item(0):
+			self.firing_rate[0, 0] = self.rates.rate_single(0)
+		return self.vout[:, 0:1]
+	
+	# First half of a step: works out the next state of every neuron from the
+	# current state of this population and its presynaptic populations, but
+	# leaves all of it untouched. Nothing other populations read changes until
+	# commit, so every layer of a network can be computed (in any order, or
+	# concurrently) before any of them is committed.
+	def compute(self, dt, I_inj = 0):
+		self.rates.set_dt(dt)
+		I_total = self.input_current(dt, I_inj, np.arange(self.size))
+		v = np.zeros((self.batch, self.size))
+		spiked = np.zeros((self.batch, self.size), dtype = np.uint8)
+		chunk = lambda start, stop: kernels.lif_next(self.v, I_total[:, start:stop], self.R_m, self.tau, self.threshold,
+													dt, start, stop, v[:, start:stop], spiked[:, start:stop])
+		run_chunks(self.pool, chunk, self.size, self.batch)
+		self.pending = (v, spiked)
+	
+	# Second half of a step: writes out the state worked out by compute
+	def commit(self):
+		v, spiked = self.pending
+		self.pending = None
+		run_chunks(self.pool, lambda start, stop: self.write_state(start, stop, v[:, start:stop], spiked[:, start:stop]),
+					self.size, self.batch)
+		return self.vout[:, :self.size]
+	
+	# Leaky integrate and fire dynamics, returns the new membrane potential of
+	# the neurons in [start, stop) and which of them spiked
+	def next_state(self, dt, start, stop, I_total):
+		v = np.zeros((self.batch, stop - start))
+		spiked = np.zeros((self.batch, stop - start), dtype = np.uint8)
+		kernels.lif_next(self.v, I_total, self.R_m, self.tau, self.threshold, dt, start, stop, v, spiked)
+		return v, spiked
+	
+	def write_state(self, start, stop, v, spiked):
+		kernels.lif_commit(self.v, self.vout, self.currspike, self.v_r, self.threshold, v, spiked, start, stop)
+		self.rates.push(slice(start, stop), spiked)
+		self.steps[start:stop] += 1
+		# Compute the firing rate if desired
+		rate_rows = start + np.nonzero(self.compute_firing_rate[start:stop])[0]
+		if len(rate_rows) > 0:
+			self.firing_rate[:, rate_rows] = self.rates.rate(rate_rows)
+
+# Exposes one of the population arrays as an attribute of a single neuron
+def population_attr(name, dtype = float):
+	def fget(self):
+		arr = getattr(self.population, name)
+		if arr.ndim == 2:
+			return dtype(arr[self.population.view_batch, self.index])
+		return dtype(arr[self.index])
+	def fset(self, value):
+		arr = getattr(self.population, name)
+		if arr.ndim == 2:
+			arr[:, self.index] = value
+		else:
+			arr[self.index] = value
+	return property(fget, fset)
+
+# A single neuron is a view onto one index of a Population. Neurons created
+# without a population get a private one so they can still be used on their own.
 class Neuron:
+	v = population_attr('v')
+	v_r = population_attr('v_r')
+	R_m = population_attr('R_m')
+	tau = population_attr('tau')
+	threshold = population_attr('threshold')
+	currspike = population_attr('currspike', int)
+	firing_rate = population_attr('firing_rate')
+	isinput = population_attr('isinput', bool)
+	compute_firing_rate = population_attr('compute_firing_rate', bool)
+	
 	def __init__(self, v_r = 0, R_m = 1, tau = 1, threshold = 0.2, **kwargs):
-		self.v = v_r
-		self.v_r = v_r
-		self.R_m = R_m
-		self.tau = tau
-		self.threshold = threshold
-		self.syns = []
-		self.spikes = Queue()
-		self.currspike = 0
-		self.firing_rate = 0
-		self.isinput = kwargs.get('is_input', False)
-		self.compute_firing_rate = kwargs.get('compute_firing_rate', True)
+		self.population = kwargs.get('population', None)
+		if self.population is None:
+			self.population = Population(capacity = 1)
+		# Passing index makes this a view onto a neuron that already exists
+		self.index = kwargs.get('index', None)
+		if self.index is None:
+			self.index = self.population.add_neuron(v_r, R_m, tau, threshold, neuron = self, **kwargs)
+		else:
+			self.population.neurons[self.index] = self
+	
+	@property
+	def syns(self):
+		syns = []
+		for proj in self.population.projections.values():
+			for syn_id in proj.post_syns(self.index):
+				pre = proj.pre.neurons[proj.indices[proj.get_slot(syn_id)]]
+				syns.append(Synapse(pre, self, id = syn_id))
+		return syns
+	
+	@property
+	def spikes(self):
+		return self.population.get_spikes(self.index)
 	
 	def add_syn(self, n_pre, tau = 1, w_init = 0.5, **kwargs):
-		syn = Synapse(n_pre, self, tau = tau, w_init = w_init, **kwargs)
-		self.syns.append(syn)
-		return syn
+		return Synapse(n_pre, self, tau = tau, w_init = w_init, **kwargs)
 	
 	def remove_syn(self, n_pre):
 		for syn in self.syns:
 			if syn.n_pre == n_pre:
-				self.syns.remove(syn)
+				syn.projection.remove_syn(syn.id)
 	
 	def get_syn(self, n_pre):
 		for syn in self.syns:
@@ -55,71 +855,124 @@ class Neuron:
 		I_list = [syn.sout() for syn in self.syns]
 		return sum(I_list)
 	
-	def add_spike(self, val, dt):
-		global t_window
-		self.currspike = val
-		self.spikes.append(val)
-		if(len(self.spikes) > t_window/dt):
-			self.spikes.popleft()
-	
 	# Returns the firing rate of spikes per second
 	def get_firing_rate(self):
-		if len(self.spikes) > 0:
-			return float(sum(self.spikes))/len(self.spikes)
+		spikes = self.spikes
+		if len(spikes) > 0:
+			return float(sum(spikes))/len(spikes)
 		else:
 			return 0
 	
 	def update(self, dt, I_inj = 0, learn = False):
-		for syn in self.syns:
-			syn.update(dt)
-		# If this neuron is input, then we just take in the injected current i.e.
-		# no synaptic connections
-		if self.isinput:
-			I_total = I_inj
-		# Otherwise aggregate all the weighted synaptic inputs and injected current
-		else:
-			I_total = self.I_syn() + I_inj
-		# Catching when current input is unreasonably high
-		if math.isnan(I_total):
-			raise Exception("Current is NaN")
-		# Leaky integrate and fire dynamics
-		dvdt = (-self.v + self.R_m * I_total)/self.tau
-		self.v = self.v + dt*dvdt
-		if(self.v >= self.threshold):
-			self.v = self.v_r
-			self.add_spike(1, dt) 
-			# Compute the firing rate if desired
-			if(self.compute_firing_rate):
-				self.firing_rate = self.get_firing_rate()
-			return self.threshold
-		else:
-			self.add_spike(0, dt)
-			# Compute the firing rate if desired
-			if(self.compute_firing_rate):
-				self.firing_rate = self.get_firing_rate()
-			return self.v
+		vout = self.population.update(dt, I_inj, learn, index = self.index)
+		return float(vout[self.population.view_batch, 0])
 
+# Records variables of a set of neurons, or synapses, every stride calls to
+# record. source is a Population (variables from its arrays, e.g. 'v' and
+# 'currspike') or a Projection ('I' and 'w'), and index picks neurons, or
+# synapse ids, out of it, all of them by default. A single index records
+# plain numbers instead of rows.
+#
+# Samples go into ring buffers holding the last capacity of them, or all of
+# them if capacity isn't positive. With flush_to set (a path with a %d in it
+# for the chunk number), every chunk samples are saved to a .npz file there
+# and the buffers start over.
+class Monitor:
+	def __init__(self, source, variables, index = None, capacity = -1, stride = 1, **kwargs):
+		self.source = source
+		self.variables = variables
+		self.is_projection = isinstance(source, Projection)
+		if index is None:
+			if self.is_projection:
+				source.compile()
+				index = np.sort(source.ids)
+			else:
+				index = np.arange(source.size)
+		self.index = index if np.isscalar(index) else np.asarray(index)
+		self.stride = stride
+		self.batch = kwargs.get('batch', None)
+		self.flush_to = kwargs.get('flush_to', None)
+		self.chunk = kwargs.get('chunk', 4096)
+		self.chunks = 0
+		if self.flush_to is not None:
+			capacity = self.chunk
+		width = None if np.isscalar(index) else len(self.index)
+		self.buffers = dict((var, TraceBuffer(capacity, width)) for var in variables)
+		self.calls = 0
+	
+	def __len__(self):
+		return len(self.buffers[self.variables[0]])
+	
+	# Current value of var for the monitored neurons or synapses
+	def sample(self, var):
+		b = self.source.post.view_batch if self.is_projection else self.source.view_batch
+		if self.batch is not None:
+			b = self.batch
+		if self.is_projection:
+			proj = self.source
+			slots = proj.get_slot(self.index)
+			if var == 'I':
+				return proj.trace_values(b, proj.trace[slots])
+			return getattr(proj, var)[slots]
+		arr = getattr(self.source, var)
+		if arr.ndim == 2:
+			return arr[b, self.index]
+		return arr[self.index]
+	
+	def record(self, t):
+		self.calls += 1
+		if (self.calls - 1) % self.stride != 0:
+			return
+		for var in self.variables:
+			self.buffers[var].push(t, self.sample(var))
+		if self.flush_to is not None and len(self) >= self.chunk:
+			self.flush()
+	
+	# Saves what the buffers hold to the next chunk file and empties them
+	def flush(self):
+		if self.flush_to is None or len(self) == 0:
+			return
+		arrays = dict((var, buf.values()) for var, buf in self.buffers.items())
+		np.savez(self.flush_to % self.chunks, t = self.times(), index = self.index, **arrays)
+		self.chunks += 1
+		self.clear()
+	
+	def clear(self):
+		for buf in self.buffers.values():
+			buf.clear()
+	
+	def times(self):
+		return self.buffers[self.variables[0]].times()
+	
+	def values(self, var):
+		return self.buffers[var].values()
+	
+	def trace(self, var):
+		return self.buffers.get(var, None)
+
+# Readers follow a single synapse or neuron with a Monitor holding its last
+# fix_length samples (or all of them). The lists the plots used to read are
+# still there as properties.
 class SynapseReader:
 	def __init__(self, synapse, fix_length = -1):
 		self.synapse = synapse
 		self.fix_length = fix_length
-		self.times = []
-		self.Is = []
-		self.ws = []
+		self.monitor = Monitor(synapse.projection, ['I', 'w'], synapse.id, fix_length)
+	
+	times = property(lambda self: list(self.monitor.times()))
+	Is = property(lambda self: list(self.monitor.values('I')))
+	ws = property(lambda self: list(self.monitor.values('w')))
+	
+	def trace(self, var_interest):
+		if var_interest == 'current':
+			return self.monitor.trace('I')
+		return None
 		
 	def read_synapse(self, nclock):
-		self.times.append(nclock.get_time())
-		self.Is.append(self.synapse.I)
-		self.ws.append(self.synapse.w)
-
-		if self.fix_length > 0 and len(self.times) >= self.fix_length:
-			self.times = self.times[-self.fix_length:]
-			self.Is = self.Is[-self.fix_length:]
-			self.ws = self.ws[-self.fix_length:]
+		self.monitor.record(nclock.get_time())
 		
 	def refresh(self):
-		self.Is = []
-		self.ws = []
+		self.monitor.clear()
 			
 class NeuronReader:
 	def __init__(self, neuron, readsyns = False, fix_length = -1, var_interest = None):
@@ -129,15 +982,22 @@ class NeuronReader:
 			self.syns = self.neuron.syns
 			self.synreaders = [SynapseReader(syn, fix_length) for syn in self.neuron.syns]
 		self.fix_length = fix_length
-		self.times = []
-		self.vs = []
-		self.spikes = []
+		self.monitor = Monitor(neuron.population, ['v', 'currspike'], neuron.index, fix_length)
+	
+	times = property(lambda self: list(self.monitor.times()))
+	vs = property(lambda self: list(self.monitor.values('v')))
+	spikes = property(lambda self: list(self.monitor.values('currspike')))
+	
+	def trace(self, var_interest):
+		if var_interest == 'voltage':
+			return self.monitor.trace('v')
+		elif var_interest == 'spikes':
+			return self.monitor.trace('currspike')
+		return None
 		
 	def change_neuron(self, neuron, readsyns = False):
 		self.neuron = neuron
-		self.times = []
-		self.vs = []
-		self.spikes = []
+		self.monitor = Monitor(neuron.population, ['v', 'currspike'], neuron.index, self.fix_length)
 		if self.readsyns:
 			self.synreaders = [SynapseReader(syn, self.fix_length) for syn in self.neuron.syns]
 			
@@ -148,21 +1008,13 @@ class NeuronReader:
 					self.synreaders.append(SynapseReader(syn, self.fix_length))
 					
 	def refresh(self):
-		self.vs = []
-		self.spikes = []
-		self.times = []
+		self.monitor.clear()
 		if self.readsyns:
 			for synreader in self.synreaders:
 				synreader.refresh()
 				
 	def read_neuron(self, nclock):
-		self.times.append(nclock.get_time())
-		self.vs.append(self.neuron.v)
-		self.spikes.append(self.neuron.currspike)
-		if self.fix_length > 0 and len(self.vs) >= self.fix_length:
-			self.times = self.times[-self.fix_length:]
-			self.vs = self.vs[-self.fix_length:]
-			self.spikes = self.spikes[-self.fix_length:]
+		self.monitor.record(nclock.get_time())
 		if self.readsyns:
 			for synreader in self.synreaders:
 				synreader.read_synapse(nclock)
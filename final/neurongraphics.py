@@ -1,63 +1,52 @@
 import pygame
-from neuron import Neuron
+from neuron import Neuron, expand_ranges
 import numpy as np
 
+# 256 entry colour table mapping a neuron's value to its colour, either
+# through custom_color or the default blue to red ramp. Tables are made once
+# per colouring function.
+luts = {}
+
+def color_lut(custom_color = None):
+	if custom_color not in luts:
+		if custom_color is None:
+			custom_color = lambda val : (val,0,255-val)
+		luts[custom_color] = np.array([custom_color(val) for val in range(256)], dtype = np.uint8)
+	return luts[custom_color]
+
+# Values (0 to 255) the neurons at idx in population are coloured by, either
+# their firing rate or how close they are to threshold
+def neuron_values(population, idx, color_by_rate = True):
+	b = population.view_batch
+	if not color_by_rate:
+		val = population.vout[b, idx] / population.threshold[idx] * 255
+	else:
+		val = population.firing_rate[b, idx] * 20 * 255
+	return np.clip(val.astype(np.int64), 0, 255)
+
 class NeuronG(Neuron):
 	def __init__(self, pos, v_r = 0, R_m = 1, tau = 1, threshold = 0.2, scale = 1, **kwargs):
 		super().__init__(v_r, R_m, tau, threshold, **kwargs)
 		self.pos = np.array(pos)
 		self.scale = scale
 		self.unit_scale = 20
-		val = int(self.v / self.threshold)
 		self.custom_color = kwargs.get('custom_color', None)
 		self.color_by_rate = kwargs.get('color_by_rate', True)
 		self.debug_color = kwargs.get('debug_color', None)
-		if self.custom_color is None:
-			self.color = (val,0,255-val)
-		else:
-			self.color = self.custom_color(val)
 	
 	def get_val(self):
-		if not self.color_by_rate:
-			val = int(vout / self.threshold * 255)
-		else:
-			val = int(self.firing_rate * 20 * 255)
-		if(val < 0):
-			val = 0
-		elif(val > 255):
-			val = 255
-		return val
+		return int(neuron_values(self.population, np.array([self.index]), self.color_by_rate)[0])
 	
-	def update(self, dt, I_inj = 0, learn = False):
-		vout = super().update(dt, I_inj, learn)
-		
+	# The color is derived from the population state whenever it is drawn, so
+	# stepping the whole population doesn't need to touch the views
+	@property
+	def color(self):
 		if self.debug_color:
-			self.color = self.debug_color
-			return vout
-			
-		if not self.color_by_rate:
-			val = int(vout / self.threshold * 255)
-			if(val < 0):
-				val = 0
-			if(val == 255):
-				self.color = (255, 255, 0)
-			else:
-				if self.custom_color is None:
-					self.color = (val,0,255-val)
-				else:
-					self.color = self.custom_color(val)
-		else:
-			val = int(self.firing_rate*20*255)
-			if val > 255:
-				val = 255
-			if(val < 0):
-				val = 0
-			if self.custom_color is None:
-					self.color = (val,0,255-val)
-			else:
-				self.color = self.custom_color(val)
-		
-		return vout
+			return self.debug_color
+		val = self.get_val()
+		if not self.color_by_rate and val == 255:
+			return (255, 255, 0)
+		return tuple(color_lut(self.custom_color)[val].tolist())
 	
 	def draw_synapses(self, screen):
 		maxI = 2
@@ -75,4 +64,152 @@ class NeuronG(Neuron):
 	def draw_neuron(self, screen):
 		pygame.draw.circle(screen, self.color, (int(self.pos[0]), int(self.pos[1])), 
 							int(self.unit_scale*self.scale))
-		
\ No newline at end of file
+		
+# Pixels of antialiased straight lines from start[i] to end[i], found for all
+# the lines at once. Steps along the longer axis one pixel at a time and
+# splits each step between the two pixels straddling the line, like
+# pygame.draw.aaline. Returns the pixel coordinates, how much of each pixel
+# the line covers and which line each came from.
+def rasterize_lines(start, end):
+	start = np.floor(start).astype(float)
+	end = np.floor(end).astype(float)
+	d = end - start
+	steep = np.abs(d[:, 1]) > np.abs(d[:, 0])
+	length = np.abs(d).max(axis = 1).astype(np.int64) + 1
+	owner = np.repeat(np.arange(len(start)), length)
+	k = np.arange(length.sum()) - np.repeat(np.cumsum(length) - length, length)
+	t = k / np.maximum(length - 1, 1)[owner]
+	x = start[owner, 0] + d[owner, 0]*t
+	y = start[owner, 1] + d[owner, 1]*t
+	steep = steep[owner]
+	major = np.rint(np.where(steep, y, x))
+	minor = np.where(steep, x, y)
+	base = np.floor(minor)
+	frac = minor - base
+	major = np.concatenate([major, major])
+	minor = np.concatenate([base, base + 1])
+	steep = np.concatenate([steep, steep])
+	xs = np.where(steep, minor, major).astype(np.int64)
+	ys = np.where(steep, major, minor).astype(np.int64)
+	return xs, ys, np.concatenate([1 - frac, frac]), np.concatenate([owner, owner])
+
+# Draws every synapse onto a grid of NeuronG views at once. The lines never
+# move, so they are rasterized once and only their colours are worked out
+# every frame, from the synaptic currents of all of them at once. Where lines
+# overlap the pixel takes the colour of the one covering it most.
+class SynapseLayer:
+	maxI = 2
+	levels = 16
+	
+	def __init__(self, grid):
+		self.views = [neuron for row in grid for neuron in row if neuron is not None]
+		self.signature = None
+		# Colour of a synapse for every value and amount of pixel coverage
+		val = np.arange(256)
+		color = np.stack([val, np.zeros(256), 255 - val], axis = 1)
+		cover = np.arange(self.levels)/(self.levels - 1.0)
+		self.lut = np.rint(color[:, None, :]*cover[None, :, None]).astype(np.uint8)
+	
+	def projections(self):
+		projs = []
+		for population in set(view.population for view in self.views):
+			projs += list(population.projections.values())
+		return projs
+	
+	def build(self, size):
+		groups = []
+		starts = []
+		ends = []
+		views_by_pop = {}
+		for view in self.views:
+			views_by_pop.setdefault(view.population, []).append(view)
+		for population, views in views_by_pop.items():
+			idx = np.array([view.index for view in views])
+			post_pos = np.array([view.pos for view in views], dtype = float).reshape(-1, 2)
+			for proj in population.projections.values():
+				proj.compile()
+				slots, owner = expand_ranges(proj.indptr[idx], proj.indptr[idx + 1])
+				# Only synapses coming from neurons that are on screen too
+				pre_pos = np.full((proj.pre.size, 2), np.nan)
+				for i, neuron in enumerate(proj.pre.neurons[:proj.pre.size]):
+					if neuron is not None and hasattr(neuron, 'pos'):
+						pre_pos[i] = neuron.pos
+				start = pre_pos[proj.indices[slots]]
+				keep = ~np.isnan(start[:, 0])
+				groups.append((proj, slots[keep]))
+				starts.append(start[keep])
+				ends.append(post_pos[owner[keep]])
+		self.groups = groups
+		if not groups:
+			self.pixels = None
+			return
+		xs, ys, cover, owner = rasterize_lines(np.concatenate(starts), np.concatenate(ends))
+		keep = (cover > 0.5/self.levels) & (xs >= 0) & (xs < size[0]) & (ys >= 0) & (ys < size[1])
+		xs, ys, cover, owner = xs[keep], ys[keep], cover[keep], owner[keep]
+		# One write per pixel, coloured by the line covering it most and as
+		# bright as all the lines on it drawn over each other would make it
+		key = xs*size[1] + ys
+		order = np.lexsort((cover, key))
+		first = np.concatenate([[True], key[order][1:] != key[order][:-1]])
+		group = np.cumsum(first) - 1
+		uncovered = np.exp(np.bincount(group, np.log(1 - np.minimum(cover[order], 0.999))))
+		last = np.append(first[1:], True)
+		sel = order[last]
+		level = np.rint((1 - uncovered)*(self.levels - 1)).astype(np.int64)
+		self.pixels = (xs[sel], ys[sel], level, owner[sel])
+	
+	def intensities(self, snapshot = None):
+		vals = []
+		for proj, slots in self.groups:
+			if snapshot is not None and proj in snapshot.traces:
+				vals.append(snapshot.traces[proj][proj.trace[slots]])
+			else:
+				vals.append(proj.traces()[proj.post.view_batch, proj.trace[slots]])
+		I = np.clip(np.concatenate(vals), 0, self.maxI)
+		return (I / self.maxI * 255).astype(np.int64)
+	
+	# snapshot, if given, is a simulation.Snapshot to draw instead of the
+	# current state of the network
+	def draw(self, screen, snapshot = None):
+		signature = [(id(proj), len(proj), proj.next_id) for proj in self.projections()]
+		if signature != self.signature:
+			self.build(screen.get_size())
+			self.signature = signature
+		if self.pixels is None:
+			return
+		xs, ys, level, owner = self.pixels
+		colors = self.lut[self.intensities(snapshot)[owner], level]
+		arr = pygame.surfarray.pixels3d(screen)
+		arr[xs, ys] = colors
+		del arr
+
+# Draws a grid of NeuronG views. The colours of the whole grid are looked up
+# at once from the population arrays when it is drawn, so nothing about the
+# views is worked out while the network is stepped, or for grids that aren't
+# on screen.
+class NeuronLayer:
+	def __init__(self, grid):
+		views = [neuron for row in grid for neuron in row if neuron is not None]
+		# Views coloured the same way from the same population are done together
+		groups = {}
+		for view in views:
+			key = (view.population, view.custom_color, view.color_by_rate)
+			groups.setdefault(key, []).append(view)
+		self.groups = []
+		for (population, custom_color, color_by_rate), members in groups.items():
+			idx = np.array([view.index for view in members])
+			pos = [(int(view.pos[0]), int(view.pos[1])) for view in members]
+			radius = [int(view.unit_scale*view.scale) for view in members]
+			debug = [view.debug_color for view in members]
+			self.groups.append((population, idx, color_by_rate, color_lut(custom_color), pos, radius, debug))
+	
+	def draw(self, screen, snapshot = None):
+		for population, idx, color_by_rate, lut, pos, radius, debug in self.groups:
+			if snapshot is not None:
+				population = snapshot.population(population)
+			vals = neuron_values(population, idx, color_by_rate)
+			colors = lut[vals]
+			if not color_by_rate:
+				colors[vals == 255] = (255, 255, 0)
+			for color, p, r, d in zip(colors.tolist(), pos, radius, debug):
+				pygame.draw.circle(screen, d or color, p, r)
@@ -1,5 +1,6 @@
 import pygame
 import numpy as np
+from neurongraphics import neuron_values
 
 class Pixel:
 	def __init__(self, pos, scale, threshold = None, **kwargs):
@@ -28,6 +29,7 @@ class Pixel:
 class PixelGrid:
 	def __init__(self, grid, threshold = None, **kwargs):
 		self.neuron_to_pixel = kwargs.get('neuron_to_pixel', False)
+		self.threshold = threshold
 		if not self.neuron_to_pixel:
 			self.screen_width = kwargs.get('screen_width', -1)
 		self.pixels = [[None for c in range(len(grid[0]))] for r in range(len(grid))]
@@ -47,24 +49,51 @@ class PixelGrid:
 
 					self.pixels[i][j] = Pixel(pixpos, pixscale, threshold)
 	
-	def update(self, *args):
+		self.values = np.full(len(self.pixels)*len(self.pixels[0]), 255, dtype = np.int64)
+		self.cells = None
 		if self.neuron_to_pixel:
-			for row in self.pixels:
-				for pixel in row:
-					pixel.update()
-		else:
-			grid = args[0]
-			for j in range(len(self.pixels[0])):
-				for i in range(len(self.pixels)):
-					self.pixels[i][j].update(grid[j][i])
-				
-		
-	def draw(self, screen):
-		screen.fill((255,255,255))
+			views = [pixel.neuron for row in self.pixels for pixel in row]
+			self.population = views[0].population
+			self.idx = np.array([view.index for view in views])
+			self.color_by_rate = views[0].color_by_rate
+	
+	# Works out which pixel (if any) covers every point of the screen by
+	# drawing each of them once in a colour that encodes its index, so the
+	# rects come out exactly where pygame.draw.rect puts them
+	def build_cells(self, size):
+		surface = pygame.Surface(size, depth = 32)
+		surface.fill((0,0,0))
+		n = 1
 		for row in self.pixels:
 			for pixel in row:
-				pixel.draw(screen)
-				
-				
-				
-				
\ No newline at end of file
+				pygame.draw.rect(surface, ((n >> 16) & 255, (n >> 8) & 255, n & 255),
+								[pixel.pos[0], pixel.pos[1], pixel.scale, pixel.scale])
+				n += 1
+		rgb = pygame.surfarray.array3d(surface).astype(np.int64)
+		# 0 is the white background, every pixel is 1 past its index
+		self.cells = (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+		self.size = size
+	
+	# Grey levels of every pixel, row by row. Either from the population the
+	# neurons are in or from the image passed in.
+	def update(self, *args, snapshot = None):
+		if self.neuron_to_pixel:
+			population = self.population
+			if snapshot is not None:
+				population = snapshot.population(population)
+			val = neuron_values(population, self.idx, self.color_by_rate)
+			if self.threshold == None:
+				self.values = 255 - val
+			else:
+				self.values = 255 - 255*(val >= self.threshold*255)
+		else:
+			grid = np.asarray(args[0])
+			self.values = (255 - grid.T*255).astype(np.int64).ravel()
+	
+	def draw(self, screen):
+		if self.cells is None or self.size != screen.get_size():
+			self.build_cells(screen.get_size())
+			# Every grey level in the screen's own pixel format
+			self.greys = np.array([screen.map_rgb((val, val, val)) for val in range(256)])
+		grey = self.greys[np.concatenate([[255], np.clip(self.values, 0, 255)])]
+		pygame.surfarray.blit_array(screen, grey[self.cells])
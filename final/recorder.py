@@ -0,0 +1,131 @@
+import os
+import threading
+import subprocess
+import pygame
+try:
+	import queue
+except ImportError:
+	import Queue as queue
+
+# Records the screen to a video without slowing down the frame loop. The
+# render thread only copies the raw pixels of every frame onto a bounded
+# queue, and a background thread hands them on. In 'pipe' mode they are
+# written straight into a long-lived ffmpeg process over stdin. In 'png' mode
+# they are saved as a numbered PNG sequence in frame_dir and put together
+# with ffmpeg once recording is over, which is what also happens if ffmpeg
+# can't be started. When the writer falls behind, frames are dropped and
+# counted rather than holding up the render thread.
+
+# Returns the path of the next numbered video in record_dir
+def next_recording(record_dir):
+	try:
+		os.makedirs(record_dir)
+	except OSError:
+		pass
+	videofiles = [f for f in os.listdir(record_dir)
+					if (os.path.isfile(os.path.join(record_dir, f)) and f != ".gitignore")]
+	vfnums = [int(os.path.splitext(vf)[0]) for vf in videofiles if os.path.splitext(vf)[0].isdigit()]
+	curr_recording_idx = max(vfnums)+1 if vfnums else 0
+	return os.path.join(record_dir, str(curr_recording_idx)+'.mp4')
+
+class Recorder:
+	def __init__(self, size, framerate, path, mode = "pipe", **kwargs):
+		self.size = size
+		self.framerate = framerate
+		self.path = path
+		self.mode = mode
+		self.frame_dir = kwargs.get('frame_dir', "frames")
+		self.ffmpegpath = kwargs.get('ffmpeg', "ffmpeg")
+		self.frames = queue.Queue(maxsize = kwargs.get('queue_size', 64))
+		self.thread = None
+		self.encoder = None
+		self.received = 0
+		self.written = 0
+		self.dropped = 0
+		self.saved_frame = 0
+	
+	def start(self):
+		if self.mode == "pipe":
+			try:
+				self.encoder = subprocess.Popen([self.ffmpegpath, '-y', '-loglevel', 'error',
+					'-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', '%dx%d' % self.size,
+					'-framerate', str(self.framerate), '-i', '-',
+					'-crf', str(self.framerate), '-pix_fmt', 'yuv420p', self.path],
+					stdin = subprocess.PIPE)
+			except OSError:
+				self.mode = "png"
+		if self.mode == "png":
+			self.clear_frames()
+		self.thread = threading.Thread(target = self.write_frames)
+		self.thread.daemon = True
+		self.thread.start()
+	
+	# Empties frame_dir before writing a new PNG sequence into it
+	def clear_frames(self):
+		try:
+			os.makedirs(self.frame_dir)
+		except OSError:
+			for f in os.listdir(self.frame_dir):
+				if os.path.isfile(os.path.join(self.frame_dir, f)):
+					os.remove(os.path.join(self.frame_dir, f))
+	
+	# Called from the render thread with the frame that was just drawn
+	def add_frame(self, screen):
+		if self.thread is None:
+			self.start()
+		self.received += 1
+		try:
+			self.frames.put_nowait(pygame.image.tostring(screen, 'RGB'))
+		except queue.Full:
+			self.dropped += 1
+	
+	def write_frames(self):
+		while True:
+			frame = self.frames.get()
+			if frame is None:
+				return
+			if self.mode == "pipe":
+				try:
+					self.encoder.stdin.write(frame)
+				except (IOError, OSError):
+					self.dropped += 1
+					continue
+			else:
+				pygame.image.save(pygame.image.frombuffer(frame, self.size, 'RGB'),
+					os.path.join(self.frame_dir,('img%d' % self.saved_frame)+".png"))
+				self.saved_frame += 1
+			self.written += 1
+	
+	# Finishes writing everything queued and closes the video
+	def close(self):
+		if self.thread is None:
+			return
+		self.frames.put(None)
+		self.thread.join()
+		self.thread = None
+		if self.encoder is not None:
+			try:
+				self.encoder.stdin.close()
+			except (IOError, OSError):
+				pass
+			code = self.encoder.wait()
+			self.encoder = None
+			if code != 0:
+				print("ffmpeg exited with code %d, no video written to %s" % (code, self.path))
+				return
+		elif self.saved_frame > 0:
+			inputfilestring = self.frame_dir + '/' + 'img%d.png'
+			try:
+				code = subprocess.call([self.ffmpegpath, '-framerate', str(self.framerate),
+					'-i', inputfilestring, '-crf', str(self.framerate), '-pix_fmt', 'yuv420p',
+					self.path])
+			except OSError:
+				print("ffmpeg not found, %d frames left in %s" % (self.saved_frame, self.frame_dir))
+				return
+			if code != 0:
+				print("ffmpeg exited with code %d, %d frames left in %s" % (code, self.saved_frame, self.frame_dir))
+				return
+		else:
+			print("No frames recorded")
+			return
+		print("Recorded %d of %d frames to %s (%d dropped)" % (self.written, self.received, self.path, self.dropped))
@@ -0,0 +1,191 @@
+import numpy as np
+import neuron
+from neuron import Population, Neuron
+from workerpool import run_tasks
+import wiring
+from wiring import wire, in_bounds
+from netcache import cache_key, cached_build
+
+# The photoreceptor -> bipolar -> orientation ganglion -> output network from
+# mnistdetector.py, without any of the drawing. Every layer is a Population so
+# the whole network can be run on a batch of images at once.
+class Retina:
+	def __init__(self, batch = 1, nneurons = 28, pop = 10, block_size = 3, sinusoidchoice = None, **kwargs):
+		if sinusoidchoice is None:
+			sinusoidchoice = {"horizontal":True, "vertical":True, "diagonal_lr":False, "diagonal_rl":False}
+		self.batch = batch
+		self.nneurons = nneurons
+		self.pop = pop
+		self.block_size = block_size
+		self.sinusoidchoice = sinusoidchoice
+		# Synchronous stepping computes every layer from the state at the
+		# start of the tick before committing any of them, instead of each
+		# layer seeing the spikes the layers before it produced this tick
+		self.synchronous = kwargs.get('synchronous', False)
+		self.pool = kwargs.get('pool', None)
+		options = {'rate_estimator': kwargs.get('rate_estimator', 'window'),
+					'event_driven': kwargs.get('event_driven', False),
+					'pool': kwargs.get('pool', None)}
+		self.photoreceptors = Population(batch = batch, **options)
+		self.oncoffs_pop = Population(batch = batch, **options)
+		self.offcons_pop = Population(batch = batch, **options)
+		self.line_detectors_pop = Population(batch = batch, **options)
+		self.output_pop = Population(batch = batch, **options)
+		# Directory to keep the compiled network in between runs, if any
+		self.cache = kwargs.get('cache', None)
+		if self.cache is None:
+			self.build()
+		else:
+			self.cached = cached_build(self.cache, self.cache_key(), self.layers, self.build)
+	
+	# The Neuron grid views are only made the first time one is asked for
+	views = ['neurongrid', 'oncoffs', 'offcons', 'line_detectors', 'line_detectors_v',
+				'line_detectors_h', 'line_detectors_dlr', 'line_detectors_drl', 'output_layer']
+	
+	def __getattr__(self, name):
+		if name in Retina.views:
+			self.make_views()
+			return self.__dict__[name]
+		raise AttributeError(name)
+	
+	# Everything the wiring depends on, neuron.py included since the cached
+	# arrays are laid out by Projection.compile
+	def cache_key(self):
+		params = {'nneurons': self.nneurons, 'pop': self.pop, 'block_size': self.block_size,
+					'sinusoidchoice': self.sinusoidchoice}
+		return cache_key(params, [__file__, wiring.__file__, neuron.__file__])
+	
+	# Populations in the order they are updated every step
+	@property
+	def layers(self):
+		return [self.photoreceptors, self.oncoffs_pop, self.offcons_pop,
+				self.line_detectors_pop, self.output_pop]
+	
+	def build(self):
+		nneurons = self.nneurons
+		neuronrows = nneurons
+		neuroncols = nneurons
+		pop = self.pop
+		BLOCK_SIZE = self.block_size
+		shape = (neuronrows, neuroncols)
+		ncells = neuronrows*neuroncols
+		
+		# photoreceptive layer
+		self.photoreceptors.add_neurons(ncells, is_input = True)
+		
+		# Bipolar cells: On center off surround and on center off surround.
+		# The surround is walked by rotating a diagonal and a neighbouring
+		# offset a quarter turn at a time, and the rotation only moves on while
+		# the neighbour is on the grid. So at the edges every offset after the
+		# first neighbour off the grid is left out.
+		self.oncoffs_pop.add_neurons(ncells)
+		self.offcons_pop.add_neurons(ncells)
+		diagonals = [(1, 1), (1, -1), (-1, -1), (-1, 1)]
+		neighbours = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+		reached = np.cumprod(np.concatenate([np.ones((ncells, 1), dtype = bool),
+								in_bounds(shape, neighbours)[:, :-1]], axis = 1), axis = 1).astype(bool)
+		surround_mask = np.concatenate([np.ones((ncells, 1), dtype = bool),
+								np.repeat(reached, 2, axis = 1)], axis = 1)
+		oncoffs_kernel = [(0, 0, 1*pop, 2, 1)]
+		offcons_kernel = [(0, 0, 1*pop, 1, -1)]
+		for diagonal, neighbour in zip(diagonals, neighbours):
+			# Off surround
+			oncoffs_kernel += [diagonal + (0.02*pop, 1, -1), neighbour + (0.1*pop, 1, -1)]
+			# On surround
+			offcons_kernel += [diagonal + (0.02*pop, 1, 1), neighbour + (0.2*pop, 1, 1)]
+		wire(self.photoreceptors, self.oncoffs_pop, oncoffs_kernel, shape, mask = surround_mask)
+		wire(self.photoreceptors, self.offcons_pop, offcons_kernel, shape, mask = surround_mask)
+		
+		# Line detecting ganglion cells
+		# each neuron is responsible for detecting its own 3x3 block of on-center off-surround cells surrounding the neuron
+		# 1) vertical line detector, 2) horizontal line detector,
+		# 3) diagonal from left to right and 4) diagonal from right to left,
+		# stored one after another for every grid position
+		self.line_detectors_pop.add_neurons(4*ncells)
+		block = [(d//BLOCK_SIZE - BLOCK_SIZE//2, d%BLOCK_SIZE - BLOCK_SIZE//2)
+					for d in range(0, BLOCK_SIZE*BLOCK_SIZE)]
+		on_line = [lambda d: d%BLOCK_SIZE == BLOCK_SIZE//2,
+					lambda d: d//BLOCK_SIZE == BLOCK_SIZE//2,
+					lambda d: d//BLOCK_SIZE == d%BLOCK_SIZE,
+					lambda d: abs(2*(BLOCK_SIZE//2) - d//BLOCK_SIZE) == d%BLOCK_SIZE]
+		detector_index = 4*np.arange(ncells)
+		for k, online in enumerate(on_line):
+			excite_on = [offset + ((0.5 if online(d) else -0.2)*pop, 2) for d, offset in enumerate(block)] #excite with on, inhibit when on
+			inhibit_off = [offset + ((-0.5 if online(d) else -0.2)*pop, 2) for d, offset in enumerate(block)] #inhibit off
+			wire(self.oncoffs_pop, self.line_detectors_pop, excite_on, shape, post_index = detector_index + k)
+			wire(self.offcons_pop, self.line_detectors_pop, inhibit_off, shape, post_index = detector_index + k)
+		
+		# Mapping back to the photoreceptive layer
+		self.output_pop.add_neurons(ncells)
+		wire(self.photoreceptors, self.output_pop, [(0, 0, 1, 1)], shape) # compose input layer
+		
+		# Wires a sinusoidal pattern from each line detector to the output
+		# neurons in its block. excite(i, j, d) says which ones are excitatory,
+		# for whole arrays of i and j at once.
+		def wire_sinusoid(k, excite, w_exc):
+			kernel = [offset + (lambda i, j, d = d: np.where(excite(i, j, d), w_exc*pop, -0.1*pop), 1)
+						for d, offset in enumerate(block)]
+			wire(self.line_detectors_pop, self.output_pop, kernel, shape, anchor = 'pre',
+					pre_index = detector_index + k)
+		
+		# Horizontal
+		if self.sinusoidchoice["horizontal"]:
+			wire_sinusoid(1,
+				lambda i, j, d: (((j%3 == 1) & (d in (3, 1, 5))) | ((j%3 == 2) & (d in (0, 4, 8)))
+								| ((j%3 == 0) & (d in (3, 7, 5)))), 1)
+		# Vertical
+		if self.sinusoidchoice["vertical"]:
+			wire_sinusoid(0,
+				lambda i, j, d: (((i%3 == 1) & (d in (1, 3, 7))) | ((i%3 == 2) & (d in (0, 4, 8)))
+								| ((i%3 == 3) & (d in (1, 3, 5)))), 0.9)
+		# LR-Diagonal
+		if self.sinusoidchoice["diagonal_lr"]:
+			wire_sinusoid(2,
+				lambda i, j, d: (((i == j) & (i%2 == 1) & (d in (0, 4, 6, 7, 8)))
+								| ((i == j) & (i%2 == 0) & (d in (3, 4, 7)))), 1)
+		# RL-Diagonal
+		if self.sinusoidchoice["diagonal_rl"]:
+			wire_sinusoid(3,
+				lambda i, j, d: (((j == (nneurons - 1 - i)) & (i % 2 == 0) & (d in (0, 1, 2, 3, 6)))
+								| ((j == (nneurons - 1 - i)) & (i % 2 == 0) & (d in (2, 4, 5)))), 1)
+	
+	# Neuron views onto every layer, laid out on the grid
+	def make_views(self):
+		neuronrows = self.nneurons
+		neuroncols = self.nneurons
+		grid = lambda population, n = 1: [[Neuron(population = population, index = n*(i*neuroncols + j) + k)
+											for j in range(0, neuroncols) for k in range(0, n)]
+											for i in range(0, neuronrows)]
+		self.neurongrid = grid(self.photoreceptors)
+		self.oncoffs = grid(self.oncoffs_pop)
+		self.offcons = grid(self.offcons_pop)
+		self.line_detectors = grid(self.line_detectors_pop, 4)
+		self.line_detectors_v = [row[0::4] for row in self.line_detectors]
+		self.line_detectors_h = [row[1::4] for row in self.line_detectors]
+		self.line_detectors_dlr = [row[2::4] for row in self.line_detectors]
+		self.line_detectors_drl = [row[3::4] for row in self.line_detectors]
+		self.output_layer = grid(self.output_pop)
+	
+	# Puts the whole network back at rest, e.g. before presenting new images
+	def reset(self, batch = None):
+		if batch is not None:
+			self.batch = batch
+		for layer in self.layers:
+			layer.reset(batch)
+	
+	# Advances the network by dt. images is a single image or a batch of them,
+	# one per batch entry.
+	def step(self, dt, images):
+		images = np.asarray(images, dtype = float).reshape(-1, self.nneurons*self.nneurons)
+		if self.synchronous:
+			inputs = [10*images, 0.5, 0.5, 0, 0]
+			run_tasks(self.pool, [lambda layer = layer, I_inj = I_inj: layer.compute(dt, I_inj)
+									for layer, I_inj in zip(self.layers, inputs)])
+			for layer in self.layers:
+				layer.commit()
+			return
+		self.photoreceptors.update(dt, I_inj = 10*images)
+		self.oncoffs_pop.update(dt, I_inj = 0.5)
+		self.offcons_pop.update(dt, I_inj = 0.5)
+		self.line_detectors_pop.update(dt)
+		self.output_pop.update(dt)
@@ -0,0 +1,136 @@
+import time
+import threading
+import numpy as np
+import timemodule
+
+# Steps a Retina on its own thread so that simulated time doesn't depend on
+# how fast the screen can be drawn. Every so often the thread copies the
+# state the views draw from into a Snapshot, and the renderer just draws the
+# latest one whenever it gets round to it.
+#
+# Modes:
+#	'realtime'	one simulated second per wall clock second
+#	'ratio'		ratio simulated seconds per wall clock second
+#	'fast'		as many steps as the machine can manage
+# When the simulation falls more than max_lag wall clock seconds behind its
+# pace the missing time is dropped rather than caught up on.
+
+# The parts of a population the views read, copied for the batch entry that
+# is on screen. Looks enough like a Population to be drawn from.
+class PopulationSnapshot:
+	def __init__(self, population):
+		b = population.view_batch
+		self.view_batch = 0
+		self.vout = population.vout[b:b+1].copy()
+		self.firing_rate = population.firing_rate[b:b+1].copy()
+		self.threshold = population.threshold
+		self.size = population.size
+
+class Snapshot:
+	def __init__(self, t, steps, layers):
+		self.t = t
+		self.steps = steps
+		self.populations = {}
+		self.traces = {}
+		for population in layers:
+			self.populations[population] = PopulationSnapshot(population)
+			for proj in population.projections.values():
+				self.traces[proj] = np.array(proj.traces()[population.view_batch])
+
+	# The copy of population, or population itself if it isn't in the snapshot
+	def population(self, population):
+		return self.populations.get(population, population)
+
+class Simulation:
+	def __init__(self, retina, dt, images, mode = 'realtime', **kwargs):
+		self.retina = retina
+		self.clock = timemodule.Clock(dt)
+		self.images = images
+		self.mode = mode
+		self.ratio = kwargs.get('ratio', 1.0)
+		self.max_lag = kwargs.get('max_lag', 0.25)
+		# Most snapshots published per wall clock second
+		self.publish_rate = kwargs.get('publish_rate', 60)
+		# Steps taken between looking at the clock
+		self.chunk = kwargs.get('chunk', 1)
+		self.steps = 0
+		self.lock = threading.Lock()
+		self.running = False
+		self.thread = None
+		# Anything still waiting to be wired up is compiled now, the renderer
+		# reads the connectivity from its own thread later on
+		for layer in retina.layers:
+			for proj in layer.projections.values():
+				proj.compile()
+		self.snapshot = Snapshot(self.clock.get_time(), 0, retina.layers)
+
+	def start(self):
+		if self.running:
+			return
+		self.running = True
+		self.thread = threading.Thread(target = self.run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def stop(self):
+		self.running = False
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+
+	# The image shown to the network from the next step on
+	def set_input(self, images):
+		self.images = images
+
+	def set_mode(self, mode, ratio = None):
+		with self.lock:
+			self.mode = mode
+			if ratio is not None:
+				self.ratio = ratio
+			self.origin = None
+
+	# Simulated seconds per wall clock second, None when running flat out
+	def pace(self):
+		if self.mode == 'realtime':
+			return 1.0
+		if self.mode == 'ratio':
+			return self.ratio
+		return None
+
+	def latest(self):
+		return self.snapshot
+
+	def publish(self):
+		self.snapshot = Snapshot(self.clock.get_time(), self.steps, self.retina.layers)
+
+	def run(self):
+		self.origin = None
+		last_publish = 0
+		while self.running:
+			wait = 0
+			with self.lock:
+				pace = self.pace()
+				now = time.time()
+				if pace is not None:
+					if self.origin is None:
+						self.origin = (now, self.clock.get_time())
+					wall0, sim0 = self.origin
+					target = sim0 + (now - wall0)*pace
+					ahead = self.clock.get_time() - target
+					if ahead >= self.clock.dt:
+						wait = ahead/pace
+					elif -ahead > self.max_lag*pace:
+						# Too far behind, start counting again from here
+						self.origin = (now, self.clock.get_time())
+			if wait > 0:
+				time.sleep(min(wait, 0.01))
+				continue
+			for _ in range(self.chunk):
+				self.retina.step(self.clock.dt, self.images)
+				self.clock.tick()
+				self.steps += 1
+			now = time.time()
+			if now - last_publish >= 1.0/self.publish_rate:
+				self.publish()
+				last_publish = now
+		self.publish()
@@ -0,0 +1,84 @@
+import numpy as np
+from collections import deque
+
+# Ring buffer of (time, value) samples for plotting. Keeps the last capacity
+# samples, or everything if capacity isn't positive, and keeps the minimum and
+# maximum of what it holds up to date as samples come and go, so the extents
+# of a trace never need a pass over it.
+#
+# Passing width makes every sample a row of width values instead, e.g. one
+# per neuron of a layer. The extents of those are worked out when asked for.
+class TraceBuffer:
+	def __init__(self, capacity = -1, width = None):
+		self.capacity = capacity
+		self.width = width
+		size = capacity if capacity > 0 else 64
+		self.t = np.zeros(size)
+		self.y = np.zeros((size,) if width is None else (size, width))
+		self.clear()
+	
+	def clear(self):
+		self.start = 0
+		self.length = 0
+		self.count = 0
+		# Monotonic queues of (sample number, value), the front of each is
+		# the current minimum/maximum
+		self.minq = deque()
+		self.maxq = deque()
+	
+	def __len__(self):
+		return self.length
+	
+	def push(self, t, y):
+		size = len(self.t)
+		if self.length == size:
+			if self.capacity > 0:
+				# Full, so the oldest sample makes way
+				self.start = (self.start + 1) % size
+				self.length -= 1
+			else:
+				self.t = np.concatenate([self.times(), np.zeros(size)])
+				self.y = np.concatenate([self.values(), np.zeros(self.y.shape)])
+				self.start = 0
+		end = (self.start + self.length) % len(self.t)
+		self.t[end] = t
+		self.y[end] = y
+		self.length += 1
+		self.count += 1
+		if self.width is None:
+			self._track(y)
+	
+	def _track(self, y):
+		seq = self.count - 1
+		while self.maxq and self.maxq[-1][1] <= y:
+			self.maxq.pop()
+		self.maxq.append((seq, y))
+		while self.minq and self.minq[-1][1] >= y:
+			self.minq.pop()
+		self.minq.append((seq, y))
+		oldest = self.count - self.length
+		while self.maxq[0][0] < oldest:
+			self.maxq.popleft()
+		while self.minq[0][0] < oldest:
+			self.minq.popleft()
+	
+	def extents(self):
+		if self.length == 0:
+			return None
+		if self.width is not None:
+			values = self.values()
+			return [values.min(), values.max()]
+		return [self.minq[0][1], self.maxq[0][1]]
+	
+	def _ordered(self, arr):
+		end = self.start + self.length
+		if end <= len(arr):
+			return arr[self.start:end]
+		return np.concatenate([arr[self.start:], arr[:end - len(arr)]])
+	
+	# Samples oldest first
+	def times(self):
+		return self._ordered(self.t)
+	
+	def values(self):
+		return self._ordered(self.y)
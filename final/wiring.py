@@ -0,0 +1,74 @@
+import numpy as np
+
+# Receptive field wiring between two layers laid out on the same grid.
+#
+# A kernel is a list of entries (d_row, d_col, w, tau, sign), tau and sign
+# being optional, or a dict {(d_row, d_col): (w, tau, sign)}. Every entry
+# connects each anchor neuron to the neuron d_row rows and d_col columns away
+# from it. With anchor = 'post' the offsets go from the postsynaptic neuron
+# to its inputs, with anchor = 'pre' from the presynaptic neuron to its
+# targets. Offsets falling off the grid are dropped.
+#
+# Any of w, tau and sign can also be a function of the anchor's (row, col),
+# called with whole arrays of rows and columns at once, for weights that
+# change across the grid.
+
+def parse_kernel(kernel):
+	if isinstance(kernel, dict):
+		kernel = [offset + tuple(np.atleast_1d(value)) for offset, value in kernel.items()]
+	entries = []
+	for entry in kernel:
+		d_row, d_col, w = entry[:3]
+		tau = entry[3] if len(entry) > 3 else 1
+		sign = entry[4] if len(entry) > 4 else 1
+		entries.append((d_row, d_col, w, tau, sign))
+	return entries
+
+# Whether every offset from every neuron on a rows x cols grid stays on it,
+# one row per neuron (in row-major order) and one column per offset
+def in_bounds(shape, offsets):
+	rows, cols = shape
+	offsets = np.asarray(offsets, dtype = np.int64).reshape(-1, 2)
+	anchor_r, anchor_c = np.divmod(np.arange(rows*cols), cols)
+	other_r = anchor_r[:, None] + offsets[:, 0]
+	other_c = anchor_c[:, None] + offsets[:, 1]
+	return (other_r >= 0) & (other_r < rows) & (other_c >= 0) & (other_c < cols)
+
+# Returns the grid index of the anchor and of the other end of every
+# connection the offsets make, along with the offset each came from. mask
+# has the same layout as in_bounds and can drop more connections. Connections
+# come out sorted by anchor and then in the order the offsets are given.
+def receptive_field(shape, offsets, mask = None):
+	rows, cols = shape
+	offsets = np.asarray(offsets, dtype = np.int64).reshape(-1, 2)
+	valid = in_bounds(shape, offsets)
+	if mask is not None:
+		valid &= mask
+	anchor, entry = np.nonzero(valid)
+	anchor_r, anchor_c = np.divmod(anchor, cols)
+	other = (anchor_r + offsets[entry, 0])*cols + anchor_c + offsets[entry, 1]
+	return anchor, other, entry
+
+# Connects pre to post with kernel in one go and returns the new synapse ids.
+# pre_index and post_index map grid positions to neuron indices when a layer
+# isn't simply one neuron per grid position, in row-major order.
+def wire(pre, post, kernel, shape, anchor = 'post', pre_index = None, post_index = None, mask = None):
+	entries = parse_kernel(kernel)
+	offsets = [(d_row, d_col) for d_row, d_col, _, _, _ in entries]
+	anchors, others, entry = receptive_field(shape, offsets, mask)
+	if anchor == 'post':
+		post_cells, pre_cells = anchors, others
+	else:
+		pre_cells, post_cells = anchors, others
+	anchor_r, anchor_c = np.divmod(anchors, shape[1])
+	values = np.zeros((3, len(anchors)))
+	for k, (_, _, w, tau, sign) in enumerate(entries):
+		sel = entry == k
+		for field, value in enumerate((w, tau, sign)):
+			if callable(value):
+				value = value(anchor_r[sel], anchor_c[sel])
+			values[field, sel] = value
+	pre_idx = pre_cells if pre_index is None else np.asarray(pre_index).ravel()[pre_cells]
+	post_idx = post_cells if post_index is None else np.asarray(post_index).ravel()[post_cells]
+	w, tau, sign = values
+	return post.connect(pre).add_syns(pre_idx, post_idx, tau = tau, w_init = w, sign = sign)
@@ -0,0 +1,192 @@
+import os
+import json
+import zlib
+import numpy as np
+
+# Checkpoints of a network's weights and neuron state for long learning runs.
+# The state of a network is a flat dict of numpy arrays, built from the
+# neurons' getState and handed back to their setState.
+#
+# Every fullEvery-th checkpoint is a full snapshot, the ones in between only
+# store how they differ from the last full one: the bits of every array XORed
+# with the same array in the snapshot. Unchanged values XOR to zeros, and
+# values that only changed a little to zeros in their sign, exponent and top
+# bits, so the bytes are regrouped by their position in the value before
+# compressing to keep those zeros together. Everything is zlib compressed in
+# an .npz file, written to a temporary file first so a crash never leaves half
+# a checkpoint. Loading a checkpoint gives back exactly the arrays that were
+# saved, so a run resumed from one carries on bit for bit (as long as its
+# inputs do). The files are the same as Orren/checkpointfile.py writes, keep
+# FORMAT in step with it.
+
+FORMAT = 1
+
+def asBytes(array):
+    return np.frombuffer(np.ascontiguousarray(array).tobytes(), dtype = np.uint8)
+
+def compress(raw, itemsize):
+    return np.frombuffer(zlib.compress(raw.reshape(-1, itemsize).T.tobytes()), dtype = np.uint8)
+
+# Stored against base when that comes out smaller, it doesn't for arrays
+# whose values have all moved, like a sliding window of spikes
+def encode(array, base = None):
+    raw = compress(asBytes(array), array.dtype.itemsize)
+    if base is not None and base.dtype == array.dtype and base.shape == array.shape:
+        xor = compress(asBytes(array) ^ asBytes(base), array.dtype.itemsize)
+        if len(xor) < len(raw):
+            return 'xor', xor
+    return 'raw', raw
+
+def decode(encoding, data, dtype, shape, base = None):
+    dtype = np.dtype(dtype)
+    raw = np.frombuffer(zlib.decompress(data.tobytes()), dtype = np.uint8)
+    raw = raw.reshape(dtype.itemsize, -1).T.ravel()
+    if encoding == 'xor':
+        raw = raw ^ asBytes(base)
+    return np.frombuffer(raw.tobytes(), dtype = dtype).reshape(shape).copy()
+
+def write(path, state, step, base = None, baseName = None):
+    meta = {'format': FORMAT, 'step': step, 'base': baseName, 'arrays': {}}
+    arrays = {}
+    for k, (name, value) in enumerate(sorted(state.items())):
+        value = np.asarray(value)
+        encoding, data = encode(value, None if base is None else base.get(name))
+        meta['arrays'][name] = [k, encoding, value.dtype.str, list(value.shape)]
+        arrays['a%d' % k] = data
+    arrays['meta'] = np.array(json.dumps(meta))
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+
+def readMeta(path):
+    with np.load(path) as f:
+        return json.loads(str(f['meta']))
+
+def read(path, base = None):
+    with np.load(path) as f:
+        meta = json.loads(str(f['meta']))
+        if meta['format'] != FORMAT:
+            raise IOError("%s is a checkpoint from another version" % path)
+        if meta['base'] is not None and base is None:
+            raise IOError("%s is stored against %s" % (path, meta['base']))
+        state = {}
+        for name, (k, encoding, dtype, shape) in meta['arrays'].items():
+            state[name] = decode(encoding, f['a%d' % k], dtype, shape,
+                                None if base is None else base.get(name))
+    return state, meta
+
+class Checkpointer:
+    def __init__(self, directory, fullEvery = 10):
+        self.directory = directory
+        self.fullEvery = fullEvery
+        self.count = 0
+        self.base = None
+        self.baseName = None
+        try:
+            os.makedirs(directory)
+        except OSError:
+            pass
+
+    def checkpoints(self):
+        names = [f for f in os.listdir(self.directory) if f.startswith('ckpt-') and f.endswith('.npz')]
+        return sorted(names)
+
+    # Saves state as of step, as a full snapshot or against the last one
+    def save(self, state, step):
+        name = 'ckpt-%010d.npz' % step
+        path = os.path.join(self.directory, name)
+        if self.base is None or self.count % self.fullEvery == 0:
+            write(path, state, step)
+            previous = self.baseName
+            self.base = {key: np.array(value) for key, value in state.items()}
+            self.baseName = name
+            self.count = 1
+            # Only the last two full snapshots and what was saved since are kept
+            if previous is not None:
+                self.prune(previous)
+        else:
+            write(path, state, step, self.base, self.baseName)
+            self.count += 1
+        return path
+
+    # Removes the checkpoints from before the full snapshot keep
+    def prune(self, keep):
+        for name in self.checkpoints():
+            if name < keep:
+                os.remove(os.path.join(self.directory, name))
+
+    # The state and step saved in path, the latest checkpoint if not given.
+    # Saving carries on against the same full snapshot.
+    def load(self, path = None):
+        if path is None:
+            names = self.checkpoints()
+            if not names:
+                return None, None
+            path = os.path.join(self.directory, names[-1])
+        baseName = readMeta(path)['base']
+        if baseName is None:
+            state, meta = read(path)
+            base, baseName = state, os.path.basename(path)
+        else:
+            base, _ = read(os.path.join(self.directory, baseName))
+            state, meta = read(path, base)
+        self.base = {key: np.array(value) for key, value in base.items()}
+        self.baseName = baseName
+        self.count = sum(1 for name in self.checkpoints() if baseName <= name <= os.path.basename(path))
+        return state, meta['step']
+
+# Per neuron states as arrays, lists (like the weights) are joined into one
+# array with how long each neuron's was next to it
+def stack(states, prefix):
+    out = {}
+    if not states:
+        return out
+    for key in states[0]:
+        values = [state[key] for state in states]
+        if isinstance(values[0], list):
+            lengths = [len(value) for value in values]
+            out[prefix + key] = np.array([x for value in values for x in value])
+            out[prefix + key + '.len'] = np.array(lengths, dtype = np.int64)
+        else:
+            out[prefix + key] = np.array(values)
+    return out
+
+def unstack(state, prefix, n):
+    states = [{} for _ in range(n)]
+    for name, values in state.items():
+        if not name.startswith(prefix) or name.endswith('.len'):
+            continue
+        key = name[len(prefix):]
+        if prefix + key + '.len' in state:
+            ends = np.cumsum(state[prefix + key + '.len'])
+            for i, value in enumerate(np.split(values, ends[:-1]) if n else []):
+                states[i][key] = value.tolist()
+        else:
+            for i, value in enumerate(values.tolist()):
+                states[i][key] = value
+    return states
+
+# Each layer's neurons, grouped by class since InputNeurons keep different state
+def groups(layer):
+    byClass = {}
+    for neuron in layer.neurons:
+        byClass.setdefault(type(neuron).__name__, []).append(neuron)
+    return sorted(byClass.items())
+
+# The state of every neuron in layers (and the weights onto them) as one dict
+def networkState(layers):
+    state = {}
+    for k, layer in enumerate(layers):
+        state['layer%d.totalTime' % k] = np.array(layer.totalTime)
+        for name, neurons in groups(layer):
+            state.update(stack([n.getState() for n in neurons], 'layer%d.%s.' % (k, name)))
+    return state
+
+# Puts a networkState back into the same layers, built the same way
+def restoreNetwork(state, layers):
+    for k, layer in enumerate(layers):
+        layer.totalTime = state['layer%d.totalTime' % k].item()
+        for name, neurons in groups(layer):
+            for n, neuronState in zip(neurons, unstack(state, 'layer%d.%s.' % (k, name), len(neurons))):
+                n.setState(neuronState)
@@ -20,6 +20,12 @@ class InputNeuron:
         pass
     def resetEpoch(self):
         pass
+
+    def getState(self):
+        return {'current': self.current}
+
+    def setState(self, state):
+        self.current = state['current']
     
 class Neuron:
     totalTime = 0
@@ -92,6 +98,24 @@ class Neuron:
         self.numberSpikes = 0
         self.epochTime = 0
 
+    # Everything that changes while running or training, as numbers and
+    # lists of numbers
+    def getState(self):
+        return {'voltage': self.voltage, 'u': self.u, 'totalTime': self.totalTime,
+                'epochTime': self.epochTime, 'numberSpikes': self.numberSpikes,
+                'spikeTimes': list(self.spikeTimes),
+                'weights': [n[0] for n in self.preSynaptic]}
+
+    def setState(self, state):
+        self.voltage = state['voltage']
+        self.u = state['u']
+        self.totalTime = state['totalTime']
+        self.epochTime = state['epochTime']
+        self.numberSpikes = state['numberSpikes']
+        self.spikeTimes = list(state['spikeTimes'])
+        for n, w in zip(self.preSynaptic, state['weights']):
+            n[0] = w
+
     def connectPreSynaptic(self,neuron,weight = None):
         if weight is None:
             weight = random.uniform(-1/math.sqrt(2),1/math.sqrt(2))